@@ -25,24 +25,36 @@
 
 """Steam Controller VDF-configurable mode"""
 
-from steamcontroller import SteamController
 from steamcontroller.config import Configurator
+from steamcontroller.uinput import DevicePool
+from steamcontroller.hub import SteamControllerHub
 from steamcontroller.daemon import Daemon
 
 import gc
 
+# uinput devices are kept between controllers and daemon runs
+POOL = DevicePool()
+
+def evminit(config_file):
+	# The mapping is reloaded each time the file is saved
+	configurator = Configurator('Steam Controller', config_file, eager = True, pool = POOL)
+	configurator.watch()
+	return configurator.evm.process
+
+def scinit(config_file, index = None):
+	return SteamControllerHub(lambda: evminit(config_file), hotplug = True, limit = 1, index = index)
+
 class SCDaemon(Daemon):
-	def __init__(self, pidfile, config_file):
+	def __init__(self, pidfile, config_file, index = None):
 		self.pidfile = pidfile
 		self.config_file = config_file
+		self.index = index
 		self.logfile = '/var/log/steam-controller.log'
 
 	def run(self):
-		config = Configurator('Steam Controller', self.config_file)
-		sc = SteamController(callback = config.evm.process)
+		sc = scinit(self.config_file, self.index)
 		sc.run()
 		del sc
-		del config
 		gc.collect()
 
 if __name__ == '__main__':
@@ -52,11 +64,12 @@ if __name__ == '__main__':
 		parser = argparse.ArgumentParser(description = __doc__)
 		parser.add_argument('command', type = str, choices = ['start', 'stop', 'restart', 'debug'])
 		parser.add_argument('-c', '--config-file', type = str, required = True)
-		parser.add_argument('-i', '--index', type = int, choices = [0,1,2,3], default = None)
+		parser.add_argument('-i', '--index', type = int, choices = [0,1,2,3], default = None,
+		                    help = 'controller to drive: 0 for a wired controller, 0 to 3 for the controllers of a wireless dongle')
 		args = parser.parse_args()
 
 		if args.index != None:
-			daemon = SCDaemon('/tmp/steamcontroller{:d}.pid'.format(args.index), args.config_file)
+			daemon = SCDaemon('/tmp/steamcontroller{:d}.pid'.format(args.index), args.config_file, args.index)
 		else:
 			daemon = SCDaemon('/tmp/steamcontroller.pid', args.config_file)
 
@@ -68,8 +81,7 @@ if __name__ == '__main__':
 			daemon.restart()
 		elif 'debug' == args.command:
 			try:
-				config = Configurator('Steam Controller', args.config_file)
-				sc = SteamController(callback = config.evm.process)
+				sc = scinit(args.config_file, args.index)
 				sc.run()
 			except KeyboardInterrupt:
 				return
@@ -24,16 +24,22 @@
 
 """Steam Controller Mouse, Keyboard mode"""
 
-from steamcontroller import SteamController, SCButtons
+from steamcontroller import SCButtons
 from steamcontroller.events import EventMapper, Pos
-from steamcontroller.uinput import Keys
+from steamcontroller.uinput import Keys, DevicePool
 
+from steamcontroller.hub import SteamControllerHub
+from steamcontroller.profiler import LatencyProfiler
 from steamcontroller.daemon import Daemon
 
 import gc
+import os
+
+# uinput devices are kept between controllers and daemon runs
+POOL = DevicePool()
 
 def evminit():
-    evm = EventMapper()
+    evm = EventMapper(eager=True, pool=POOL)
     evm.setPadMouse(Pos.RIGHT)
     evm.setPadScroll(Pos.LEFT)
     evm.setStickButtons([Keys.KEY_UP,
@@ -65,13 +71,40 @@ def evminit():
 
     return evm
 
+def evmprocess():
+    return evminit().process
+
+def scinit(hub=False, profile=None, index=None):
+    prof = None
+    if profile is not None:
+        prof = LatencyProfiler()
+        prof.dumpOnSignal(profile)
+
+    def _evminit():
+        evm = evminit()
+        evm.setProfiler(prof)
+        return evm.process
+
+    return SteamControllerHub(_evminit,
+                              hotplug=True,
+                              limit=None if hub else 1,
+                              profiler=prof,
+                              index=index)
+
 class SCDaemon(Daemon):
+    hub = False
+    profile = None
+    index = None
+    workers = False
+
     def run(self):
-        evm = evminit()
-        sc = SteamController(callback=evm.process)
+        if self.workers:
+            from steamcontroller.supervisor import Supervisor
+            Supervisor(evmprocess).run()
+            return
+        sc = scinit(self.hub, self.profile, self.index)
         sc.run()
         del sc
-        del evm
         gc.collect()
 
 if __name__ == '__main__':
@@ -80,12 +113,24 @@ if __name__ == '__main__':
     def _main():
         parser = argparse.ArgumentParser(description=__doc__)
         parser.add_argument('command', type=str, choices=['start', 'stop', 'restart', 'debug'])
-        parser.add_argument('-i', '--index', type=int, choices=[0,1,2,3], default=None)
+        parser.add_argument('-i', '--index', type=int, choices=[0,1,2,3], default=None,
+                            help='controller to drive: 0 for a wired controller, 0 to 3 for the controllers of a wireless dongle')
+        parser.add_argument('-a', '--all', action='store_true',
+                            help='drive all controllers from this process')
+        parser.add_argument('-w', '--workers', action='store_true',
+                            help='drive each controller from its own worker process')
+        parser.add_argument('-p', '--profile', type=str, default=None,
+                            help='measure input latency, append histograms to this file on SIGUSR1')
         args = parser.parse_args()
         if args.index != None:
             daemon = SCDaemon('/tmp/steamcontroller{:d}.pid'.format(args.index))
         else:
             daemon = SCDaemon('/tmp/steamcontroller.pid')
+        daemon.hub = args.all
+        daemon.index = args.index
+        daemon.workers = args.workers
+        if args.profile is not None:
+            daemon.profile = os.path.abspath(args.profile)
 
         if 'start' == args.command:
             daemon.start()
@@ -95,9 +140,11 @@ if __name__ == '__main__':
             daemon.restart()
         elif 'debug' == args.command:
             try:
-                evm = evminit()
-                sc = SteamController(callback=evm.process)
-                sc.run()
+                if args.workers:
+                    daemon.run()
+                else:
+                    sc = scinit(args.all, args.profile, args.index)
+                    sc.run()
             except KeyboardInterrupt:
                 return
 
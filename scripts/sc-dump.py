@@ -25,15 +25,28 @@
 """Steam Controller USB Dumper"""
 
 import sys
+import argparse
 from steamcontroller import SteamController
 
 def dump(_, sci):
     print(sci)
 
+def nodump(_, sci):
+    pass
+
 def _main():
 
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-r', '--record', type=str, default=None,
+                        help='record raw reports to a session file instead of printing them')
+    args = parser.parse_args()
+
     try:
-        sc = SteamController(callback=dump)
+        if args.record:
+            sc = SteamController(callback=nodump)
+            sc.record(args.record)
+        else:
+            sc = SteamController(callback=dump)
         sc.run()
     except KeyboardInterrupt:
         pass
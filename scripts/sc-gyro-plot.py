@@ -24,14 +24,15 @@
 
 """Steam Controller gyro data plot"""
 
-from steamcontroller import SteamController
+from steamcontroller import SteamController, SCStatus
+from steamcontroller.batch import BatchCollector
+from steamcontroller.settings import DEFAULT_SETTINGS, ImuModes
 from PySide import QtGui
 import pyqtgraph as pg
-import time
-import struct
+import numpy
 
 run = True
-times = []
+times = numpy.zeros(0)
 
 def _main():
     app = QtGui.QApplication([])
@@ -73,13 +74,13 @@ def _main():
 
 
     imu = {
-        'gpitch' : [],
-        'groll'  : [],
-        'gyaw'   : [],
-        'q1'     : [],
-        'q2'     : [],
-        'q3'     : [],
-        'q4'     : [],
+        'gpitch' : numpy.zeros(0),
+        'groll'  : numpy.zeros(0),
+        'gyaw'   : numpy.zeros(0),
+        'q1'     : numpy.zeros(0),
+        'q2'     : numpy.zeros(0),
+        'q3'     : numpy.zeros(0),
+        'q4'     : numpy.zeros(0),
     }
 
     curves = {
@@ -92,34 +93,23 @@ def _main():
         'q4'     : p4.plot(times, [], pen=(3, 4), name='4'),
     }
 
-    def update(sc, sci):
+    def update(sc, reports, stamps):
         global times
-        if sci.status != 15361:
+        inputs = reports['status'] == SCStatus.INPUT
+        if not inputs.any():
             return
-        cur = time.time()
-        times.append(cur)
-        times = [x for x in times if cur - x <= 10.0]
+        times = numpy.concatenate((times, stamps[inputs]))
+        keep = times >= times[-1] - 10.0
+        times = times[keep]
 
         for name in imu.keys():
-            imu[name].append(sci._asdict()[name])
-            nt = len(times)
-            ni = len(imu[name])
-            if nt < ni:
-                imu[name] = imu[name][-nt:]
-            elif nt > ni:
-                times = times[nt-ni:]
+            imu[name] = numpy.concatenate((imu[name], reports[name][inputs]))[keep]
             curves[name].setData(times, imu[name])
 
     app.processEvents()
-    sc = SteamController(callback=update)
-    sc.handleEvents()
-    sc._sendControl(struct.pack('>' + 'I' * 6,
-                                0x87153284,
-                                0x03180000,
-                                0x31020008,
-                                0x07000707,
-                                0x00301400,
-                                0x2f010000))
+    sc = SteamController(callback=None,
+                         settings=DEFAULT_SETTINGS._replace(imu=ImuModes.GYRO_QUATERNION))
+    batch = BatchCollector(sc, update, size=32, period=0.05)
     def closeEvent(event):
         global run
         run = False
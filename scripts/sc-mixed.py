@@ -24,19 +24,22 @@
 
 """Steam Controller XBOX360 Gamepad Emulator"""
 
-from steamcontroller import \
-    SteamController, \
-    SCButtons
+from steamcontroller import SCButtons
 from steamcontroller.events import \
     EventMapper, \
     Pos
 from steamcontroller.uinput import \
     Keys, \
-    Axes
+    Axes, \
+    DevicePool
+from steamcontroller.hub import SteamControllerHub
 from steamcontroller.daemon import Daemon
 
 import gc
 
+# uinput devices are kept between controllers and daemon runs
+POOL = DevicePool()
+
 def set_evm_pad(evm):
     evm.setStickAxes(Axes.ABS_X, Axes.ABS_Y)
     evm.setPadAxes(Pos.RIGHT, Axes.ABS_RX, Axes.ABS_RY)
@@ -99,18 +102,21 @@ def toggle_callback(evm, btn, pressed):
         pad = not pad
 
 def evminit():
-    evm = EventMapper()
+    evm = EventMapper(eager=True, pool=POOL)
     set_evm_pad(evm)
     evm.setButtonCallback(SCButtons.STEAM, toggle_callback)
     return evm
 
+def scinit(index=None):
+    return SteamControllerHub(lambda: evminit().process, hotplug=True, limit=1, index=index)
+
 class SCDaemon(Daemon):
+    index = None
+
     def run(self):
-        evm = evminit()
-        sc = SteamController(callback=evm.process)
+        sc = scinit(self.index)
         sc.run()
         del sc
-        del evm
         gc.collect()
 
 if __name__ == '__main__':
@@ -119,12 +125,14 @@ if __name__ == '__main__':
     def _main():
         parser = argparse.ArgumentParser(description=__doc__)
         parser.add_argument('command', type=str, choices=['start', 'stop', 'restart', 'debug'])
-        parser.add_argument('-i', '--index', type=int, choices=[0,1,2,3], default=None)
+        parser.add_argument('-i', '--index', type=int, choices=[0,1,2,3], default=None,
+                            help='controller to drive: 0 for a wired controller, 0 to 3 for the controllers of a wireless dongle')
         args = parser.parse_args()
         if args.index != None:
             daemon = SCDaemon('/tmp/steamcontroller{:d}.pid'.format(args.index))
         else:
             daemon = SCDaemon('/tmp/steamcontroller.pid')
+        daemon.index = args.index
 
         if 'start' == args.command:
             daemon.start()
@@ -134,8 +142,7 @@ if __name__ == '__main__':
             daemon.restart()
         elif 'debug' == args.command:
             try:
-                evm = evminit()
-                sc = SteamController(callback=evm.process)
+                sc = scinit(args.index)
                 sc.run()
             except KeyboardInterrupt:
                 return
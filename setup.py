@@ -32,4 +32,5 @@ setup(name='python-steamcontroller',
       license='MIT',
       platforms=['Linux'],
       install_requires=deps,
+      extras_require={'batch': ['numpy']},
       ext_modules=[uinput, ])
@@ -19,12 +19,19 @@
 # THE SOFTWARE.
 
 import usb1
-from collections import namedtuple
+from collections import namedtuple, deque
 import struct
 from enum import IntEnum
 
-from threading import Timer
-from time import time
+from steamcontroller.tools import monotonic
+from steamcontroller.scheduler import Scheduler
+from steamcontroller.control import ControlQueue
+from steamcontroller.recorder import SessionWriter
+from steamcontroller.settings import \
+    DEFAULT_SETTINGS, \
+    IMU_FIELDS, \
+    ImuModes, \
+    settingsMessages
 
 
 VENDOR_ID = 0x28de
@@ -36,6 +43,13 @@ HPERIOD  = 0.02
 LPERIOD  = 0.5
 DURATION = 1.0
 
+# Number of interrupt transfers kept in flight
+TRANSFERS = 4
+
+# Reports arriving at most this far behind the last one are late, further
+# behind the sequence is considered restarted
+SEQ_WINDOW = 64
+
 STEAM_CONTROLER_FORMAT = [
     ('x',   'ukn_00'),
     ('x',   'ukn_01'),
@@ -66,13 +80,20 @@ STEAM_CONTROLER_FORMAT = [
 
 _FORMATS, _NAMES = zip(*STEAM_CONTROLER_FORMAT)
 
+# Report layout compiled once, shared by all decoders
+SCI_STRUCT = struct.Struct('<' + ''.join(_FORMATS))
+
 EXITCMD = struct.pack('>' + 'I' * 2,
                       0x9f046f66,
                       0x66210000)
 
 SteamControllerInput = namedtuple('SteamControllerInput', ' '.join([x for x in _NAMES if not x.startswith('ukn_')]))
 
-SCI_NULL = SteamControllerInput._make(struct.unpack('<' + ''.join(_FORMATS), b'\x00' * 64))
+SCI_NULL = SteamControllerInput._make(SCI_STRUCT.unpack(b'\x00' * 64))
+
+# Claimed controller interface: usb handle, product id, interrupt endpoint,
+# control index and interface number
+SCInterface = namedtuple('SCInterface', 'handle pid endpoint ccidx number')
 
 class SCStatus(IntEnum):
     INPUT = 0x01
@@ -103,171 +124,316 @@ class HapticPos(IntEnum):
     RIGHT = 0
     LEFT = 1
 
+class ReportDecoder(object):
+    """
+    Decode raw usb reports into SteamControllerInput tuples.
+
+    Reports are read in place with a precompiled struct, so the libusb
+    transfer buffer (or any object supporting the buffer protocol) can be
+    given directly without copying it first.
+
+    When only some fields are needed, the other ones are skipped as padding
+    by the struct and the reports are decoded into SteamControllerFields
+    tuples holding only the asked fields, in report order. Reading another
+    field fails instead of giving a wrong value.
+    """
+
+    def __init__(self, fields=None):
+        """
+        Constructor
+
+        @param iterable fields  SteamControllerInput field names to decode,
+                                None for all
+        """
+        self.type = SteamControllerInput
+        self._unpack = SCI_STRUCT.unpack_from
+
+        if fields is not None:
+            unknown = set(fields) - set(SteamControllerInput._fields)
+            if unknown:
+                raise ValueError('Unknown report fields: {}'.format(', '.join(sorted(unknown))))
+
+            formats = []
+            names = []
+            for fmt, name in STEAM_CONTROLER_FORMAT:
+                if name in fields:
+                    formats.append(fmt)
+                    names.append(name)
+                else:
+                    formats.append('{}x'.format(struct.calcsize(fmt)))
+            self.type = namedtuple('SteamControllerFields', names)
+            self._unpack = struct.Struct('<' + ''.join(formats)).unpack_from
+
+        self._make = self.type._make
+
+    def decode(self, buf, offset=0):
+        """
+        Decode one report
+
+        @param buffer buf       raw report (bytes, bytearray, memoryview, ...)
+        @param int offset       offset of the report in buf
+
+        @return SteamControllerInput
+        """
+        return self._make(self._unpack(buf, offset))
+
+# Fields read by SteamController itself
+_SC_FIELDS = frozenset(['status', 'seq', 'buttons', 'ltrig', 'rtrig'])
+
+def _feedbackMessage(position, amplitude=128, period=0, count=1):
+    """Build an haptic feedback control message"""
+    return struct.pack('<BBBHHH', 0x8f, 0x07, position, amplitude, period, count)
+
 class SteamController(object):
 
-    def __init__(self, callback, callback_args=None):
+    def __init__(self, callback, callback_args=None, transfers=TRANSFERS,
+                 transport=None, scheduler=None, profiler=None, fields=None,
+                 settings=None):
         """
         Constructor
 
         callback: function called on usb message must take at lead a
-        SteamControllerInput as first argument
+        SteamControllerInput as first argument, None when reports are only
+        read by raw listeners (see addRawListener)
 
         callback_args: Optional arguments passed to the callback afer the
         SteamControllerInput argument
+
+        transfers: Number of interrupt transfers kept in flight, so the
+        endpoint is never left without a queued transfer while the callback
+        runs (only used when transport is not given)
+
+        transport: Optional Transport connected to the controller (see
+        steamcontroller.transport). By default the first free usb controller
+        is searched and claimed.
+
+        scheduler: Optional Scheduler shared with other controllers
+
+        profiler: Optional LatencyProfiler timing the decoding and giving
+        the completion time of each report to the callback (see
+        steamcontroller.profiler)
+
+        fields: Optional SteamControllerInput field names read by the
+        callback, like EventMapper.getFields(). The callback is then given
+        SteamControllerFields tuples with only these fields and the ones
+        SteamController reads itself (see ReportDecoder). Raw listeners
+        still get whole reports. By default all fields are decoded.
+
+        settings: Optional Settings applied at start (see
+        steamcontroller.settings). By default lizard mode and the IMU are
+        off, the IMU is turned on when fields include IMU fields.
         """
-        self._handle = None
+        self._transport = None
+        self._timer = None
+        self._tick = None
+        self._tick_timer = None
         self._cb = callback
         self._cb_args = callback_args
-        self._cmsg = []
-        self._ctx = usb1.USBContext()
-
-        handle = []
-        pid = []
-        endpoint = []
-        ccidx = []
-        for i in range(len(PRODUCT_ID)):
-            _pid = PRODUCT_ID[i]
-            _endpoint = ENDPOINT[i]
-            _ccidx = CONTROLIDX[i]
-
-            _handle = self._ctx.openByVendorIDAndProductID(
-                VENDOR_ID, _pid,
-                skip_on_error=True,
-            )
-            if _handle != None:
-                handle.append(_handle)
-                pid.append(_pid)
-                endpoint.append(_endpoint)
-                ccidx.append(_ccidx)
-
-        if len(handle) == 0:
-            raise ValueError('No SteamControler Device found')
-
-        claimed = False
-        for i in range(len(handle)):
-
-            self._ccidx = ccidx[i]
-            self._handle = handle[i]
-            self._pid = pid[i]
-            self._endpoint = endpoint[i]
-            dev = handle[i].getDevice()
-            cfg = dev[0]
-
-            try:
-                for inter in cfg:
-                    for setting in inter:
-                        number = setting.getNumber()
-                        if self._handle.kernelDriverActive(number):
-                            self._handle.detachKernelDriver(number)
-                        if (setting.getClass() == 3 and
-                            setting.getSubClass() == 0 and
-                            setting.getProtocol() == 0 and
-                            number == i+1):
-                            self._handle.claimInterface(number)
-                            self._number = number
-                            claimed = True
-            except usb1.USBErrorBusy:
-                claimed = False
-
-            if claimed:
-                break
-
-        if not claimed:
-            raise ValueError('All SteamControler are busy')
-
-        self._transfer_list = []
-        transfer = self._handle.getTransfer()
-        transfer.setInterrupt(
-            usb1.ENDPOINT_IN | self._endpoint,
-            64,
-            callback=self._processReceivedData,
-        )
-        transfer.submit()
-        self._transfer_list.append(transfer)
+        self._cmsg = ControlQueue(EXITCMD)
+        self._raw_listeners = []
+        self._recorder = None
+        self._ring = None
+        self._sched = scheduler if scheduler is not None else Scheduler()
+        owner = getattr(callback, '__self__', None)
+        if fields is not None:
+            fields = set(fields) | _SC_FIELDS
+        self._decode = ReportDecoder(fields).decode
+
+        if settings is None:
+            settings = DEFAULT_SETTINGS
+            if fields is not None and fields & IMU_FIELDS:
+                settings = settings._replace(imu=ImuModes.GYRO_QUATERNION)
+        self._settings = settings
+        self._prof = profiler
+        self._rx_stamps = deque()
+        self._seq_last = None
+        self._seq_stats = {
+            'lost' : 0,
+            'duplicates' : 0,
+            'reordered' : 0,
+        }
+
+        if transport is None:
+            from steamcontroller.transport import USBTransport
+            transport = USBTransport(transfers=transfers)
+        self._transport = transport
 
         self._period = LPERIOD
 
-        if self._pid == 0x1102:
-            self._timer = Timer(LPERIOD, self._callbackTimer)
-            self._timer.start()
+        # Wired controllers only report changes, a timer repeats the last
+        # input until the controller is left at rest
+        self._ticks = transport.pid == 0x1102
+        # Callbacks adding their own ticks (see addTicks) do not need the
+        # last input repeated once the controller is at rest
+        self._cb_ticks = hasattr(owner, 'tick')
+        self._idle = False
+        self._wakeups = 0
+        self._wake_start = monotonic()
+        self._wake_count = 0
+        self._wake_rate = 0.0
+
+        if self._ticks:
+            self._timer = self._sched.schedule(LPERIOD, self._callbackTimer)
         else:
             self._timer = None
 
         self._tup = None
-        self._lastusb = time()
-
-        # Disable Haptic auto feedback
-
-        self._ctx.handleEvents()
-        self._sendControl(struct.pack('>' + 'I' * 1,
-                                      0x81000000))
-        self._ctx.handleEvents()
-        self._sendControl(struct.pack('>' + 'I' * 6,
-                                      0x87153284,
-                                      0x03180000,
-                                      0x31020008,
-                                      0x07000707,
-                                      0x00300000,
-                                      0x2f010000))
-        self._ctx.handleEvents()
+        self._lastusb = monotonic()
+
+        transport.start(self._receive, self._deliver)
+
+        # Disable lizard mode and haptic auto feedback
+
+        for msg in settingsMessages(settings):
+            transport.handleEvents(0)
+            self._sendControl(msg)
+        transport.handleEvents(0)
+
+    def _cancelTimers(self):
+        if self._timer:
+            self._sched.cancel(self._timer)
+            self._timer = None
+        if self._tick_timer:
+            self._sched.cancel(self._tick_timer)
+            self._tick_timer = None
 
     def _close(self):
-        if self._handle:
+        self.stopRecording()
+        self._cancelTimers()
+        if self._transport is not None and self._transport.isOpen():
             self._sendControl(EXITCMD)
-            self._handle.releaseInterface(self._number)
-            self._handle.resetDevice()
-            self._handle.close()
-            self._handle = None
+            self._transport.close()
+
+    def _detach(self):
+        """Forget an unplugged device, and release inputs held by the callback"""
+        self.stopRecording()
+        self._transport.detach()
+        if self._tup is not None:
+            self._tup = SCI_NULL._replace(status=SCStatus.INPUT)
+            self._callback()
+        self._cancelTimers()
 
     def __del__(self):
         self._close()
 
     def _sendControl(self, data, timeout=0):
+        self._transport.sendControl(data, timeout)
 
-        zeros = b'\x00' * (64 - len(data))
+    def addExit(self):
+        self._cmsg.addExit()
 
-        self._handle.controlWrite(request_type=0x21,
-                                  request=0x09,
-                                  value=0x0300,
-                                  index=self._ccidx,
-                                  data=data + zeros,
-                                  timeout=timeout)
+    def addControl(self, data):
+        """
+        Add a configuration message to be send on next usb tick, before any
+        pending haptic feedback
 
-    def addExit(self):
-        self._cmsg.insert(0, EXITCMD)
+        @param bytes data       control message
+        """
+        self._cmsg.addConfig(data)
+
+    def getSettings(self):
+        """@return Settings       settings applied or queued"""
+        return self._settings
+
+    def applySettings(self, settings=None, **changes):
+        """
+        Change controller settings at runtime, only registers that differ
+        from the current settings are sent, on next usb tick
+
+        @param Settings settings    new settings, current ones by default
+        @param changes              Settings fields to change, like
+                                    imu=ImuModes.GYRO_QUATERNION
+        """
+        new = (settings if settings is not None else self._settings)._replace(**changes)
+        for msg in settingsMessages(new, self._settings):
+            self.addControl(msg)
+        self._settings = new
 
     def addFeedback(self, position, amplitude=128, period=0, count=1):
         """
-        Add haptic feedback to be send on next usb tick
+        Add haptic feedback to be send on next usb tick, replacing the one
+        still pending on the same position
 
         @param int position     haptic to use 1 for left 0 for right
         @param int amplitude    signal amplitude from 0 to 65535
         @param int period       signal period from 0 to 65535
         @param int count        number of period to play
         """
-        self._cmsg.insert(0, struct.pack('<BBBHHH', 0x8f, 0x07, position, amplitude, period, count))
-
-    def _processReceivedData(self, transfer):
-        """Private USB async Rx function"""
-
-        if (transfer.getStatus() != usb1.TRANSFER_COMPLETED or
-            transfer.getActualLength() != 64):
-            return
-
-        data = transfer.getBuffer()
-        tup = SteamControllerInput._make(struct.unpack('<' + ''.join(_FORMATS), data))
+        self._cmsg.addHaptic(position, _feedbackMessage(position, amplitude, period, count))
+
+    def _receive(self, buf):
+        """Private report reception, called while buf is valid"""
+        if self._raw_listeners:
+            now = monotonic()
+            for listener in self._raw_listeners:
+                listener(buf, now)
+        if self._prof is None:
+            return self._decode(buf)
+        start = monotonic()
+        tup = self._decode(buf)
+        self._prof.add('decode', monotonic() - start)
+        self._rx_stamps.append(start)
+        return tup
+
+    def _deliver(self, tup):
+        """Private report delivery, called in reception order"""
+        if self._prof is not None:
+            self._prof.begin(self._rx_stamps.popleft())
+        self._handleInput(tup)
+
+    def _handleInput(self, tup):
+        """Update the controller state from a report and run the callback"""
         if tup.status == SCStatus.INPUT:
+            if not self._checkSeq(tup.seq):
+                return
             self._tup = tup
-
+            if self._idle:
+                self._wake()
+        elif tup.status == SCStatus.HOTPLUG:
+            # Wireless controller connected or disconnected, seq restarts
+            self._seq_last = None
+            self._park()
+            return
+        elif tup.status == SCStatus.IDLE:
+            # Nothing to map until the next input
+            self._park()
+            return
         self._callback()
-        transfer.submit()
+
+    def _checkSeq(self, seq):
+        """
+        Track the 16 bits report sequence number
+
+        @return bool            False for a report to suppress: a duplicate,
+                                or an older report than the last delivered
+        """
+        last = self._seq_last
+        if last is None:
+            self._seq_last = seq
+            return True
+
+        diff = (seq - last) & 0xffff
+        if diff == 0:
+            self._seq_stats['duplicates'] += 1
+            return False
+        if diff > 0x10000 - SEQ_WINDOW:
+            # Late report, it was counted lost when the next one came
+            self._seq_stats['reordered'] += 1
+            if self._seq_stats['lost'] > 0:
+                self._seq_stats['lost'] -= 1
+            return False
+
+        if diff < 0x8000:
+            self._seq_stats['lost'] += diff - 1
+        self._seq_last = seq
+        return True
 
     def _callback(self):
 
-        if self._tup is None:
+        if self._tup is None or self._cb is None:
             return
 
-        self._lastusb = time()
+        self._lastusb = monotonic()
 
         if isinstance(self._cb_args, (list, tuple)):
             self._cb(self, self._tup, *self._cb_args)
@@ -276,18 +442,53 @@ class SteamController(object):
 
         self._period = HPERIOD
 
+    def _park(self):
+        """Stop timer wakeups until the next input"""
+        if self._timer:
+            self._sched.cancel(self._timer)
+            self._timer = None
+        self._idle = True
+
+    def _wake(self):
+        self._idle = False
+        if self._ticks and self._timer is None:
+            self._period = HPERIOD
+            self._timer = self._sched.schedule(HPERIOD, self._callbackTimer)
+
+    def _atRest(self):
+        """Return True when repeating the last input has no effect"""
+        tup = self._tup
+        return (self._cb is None or tup is None or
+                (tup.buttons == 0 and tup.ltrig == 0 and tup.rtrig == 0))
+
+    def _countWakeup(self, now, n=1):
+        """Count timer wakeups, the rate is updated every minute"""
+        self._wakeups += n
+        self._wake_count += n
+        elapsed = now - self._wake_start
+        if elapsed >= 60.0:
+            self._wake_rate = self._wake_count * 60.0 / elapsed
+            self._wake_count = 0
+            self._wake_start = now
+
     def _callbackTimer(self):
 
-        d = time() - self._lastusb
-        self._timer.cancel()
+        now = monotonic()
+        self._timer = None
+        self._countWakeup(now)
 
+        d = now - self._lastusb
+
+        if self._atRest() and (self._cb_ticks or d > DURATION):
+            self._park()
+            return
         if d > DURATION:
+            # Something is held, keep slow ticks (long steam press to exit)
             self._period = LPERIOD
 
-        self._timer = Timer(self._period, self._callbackTimer)
-        self._timer.start()
+        self._timer = self._sched.schedule(self._period, self._callbackTimer)
 
-        if self._tup is None:
+        if self._tup is None or self._cb is None:
             return
 
         if d < HPERIOD:
@@ -299,22 +500,142 @@ class SteamController(object):
             self._cb(self, self._tup)
 
 
+    def addTicks(self, tick, duration):
+        """
+        Call a function between reports until it is done, like a trackball
+        left rolling by EventMapper. Only the last added function is kept.
+
+        @param function tick    called with this SteamController, returns
+                                the time left in seconds, 0 when done
+        @param float duration   time left in seconds before the first call
+                                is no longer needed
+        """
+        self._tick = tick
+        if self._tick_timer is None:
+            self._tick_timer = self._sched.schedule(min(HPERIOD, duration),
+                                                    self._tickTimer)
+
+    def _tickTimer(self):
+        self._tick_timer = None
+        self._countWakeup(monotonic())
+        left = self._tick(self)
+        if left > 0.0:
+            self._tick_timer = self._sched.schedule(min(HPERIOD, left),
+                                                    self._tickTimer)
+        else:
+            self._tick = None
+
+    def addRawListener(self, listener):
+        """
+        Add a function called with each raw 64 bytes report and its monotonic
+        reception time, before decoding. The buffer is reused by the next usb
+        transfer, copy it to keep it.
+
+        @param function listener        function(report, timestamp)
+        """
+        self._raw_listeners.append(listener)
+
+    def removeRawListener(self, listener):
+        self._raw_listeners.remove(listener)
+
+    def record(self, path):
+        """
+        Record raw reports to a session file (see steamcontroller.recorder)
+
+        @param str path         session file to create
+        """
+        self.stopRecording()
+        self._recorder = SessionWriter(path,
+                                       self._transport.pid,
+                                       self._transport.endpoint,
+                                       self._transport.interface)
+        self.addRawListener(self._recorder)
+
+    def stopRecording(self):
+        """Stop recording and close the session file"""
+        if self._recorder is not None:
+            self.removeRawListener(self._recorder)
+            self._recorder.close()
+            self._recorder = None
+
+    def getStats(self):
+        """
+        Get reception counters
+
+        reports: reports delivered to the callback
+        dropped: transfers completed in error or with a short report
+        starved: completions that found no other transfer in flight, a sign
+                 that more transfers are needed
+        inflight: transfers currently submitted, lower than the transfers
+                 asked for when some could not be submitted again
+        lost:    transfers in error that could not be submitted again
+        cmsg_*:  control queue counters (see ControlQueue.getStats)
+        seq_lost:       reports missing from the sequence numbers
+        seq_duplicates: reports repeating the last sequence number, they
+                        are not given to the callback
+        seq_reordered:  reports older than the last delivered one, not
+                        given to the callback either
+        idle:           1 while timer wakeups are stopped, waiting for input
+        wakeups:        timer wakeups since start
+        wakeups_per_minute: timer wakeups rate over the last minute
+        ring_*:         reader thread ring counters, once run with a reader
+                        thread (see steamcontroller.threaded)
+
+        The first five come from the transport and may differ for other
+        transports than usb. reports includes the suppressed ones.
+
+        @return dict            copy of the counters
+        """
+        stats = self._transport.getStats()
+        for key, val in self._cmsg.getStats().items():
+            stats['cmsg_' + key] = val
+        for key, val in self._seq_stats.items():
+            stats['seq_' + key] = val
+        self._countWakeup(monotonic(), 0)
+        stats['idle'] = int(self._idle)
+        stats['wakeups'] = self._wakeups
+        stats['wakeups_per_minute'] = self._wake_rate
+        if self._ring is not None:
+            for key, val in self._ring.getStats().items():
+                stats['ring_' + key] = val
+        return stats
+
+    def isRunning(self):
+        """Return True while usb reports are still being received"""
+        return self._transport.isRunning()
+
+    def _sendPending(self):
+        """Send queued control messages, return False once exit is sent"""
+        cmsg = self._cmsg.pop()
+        while cmsg is not None:
+            self._sendControl(cmsg)
+            if cmsg == EXITCMD:
+                return False
+            cmsg = self._cmsg.pop()
+        return True
+
+    def _handleEvents(self):
+        # Wait for events until the next timer deadline, then run timers
+        self._transport.handleEvents(self._sched.timeout())
+        self._sched.runPending()
+
     def run(self):
         """Fucntion to run in order to process usb events"""
-        if self._handle:
+        if self._transport.isOpen():
             try:
-                while any(x.isSubmitted() for x in self._transfer_list):
-                    self._ctx.handleEvents()
-                    if len(self._cmsg) > 0:
-                        cmsg = self._cmsg.pop()
-                        self._sendControl(cmsg)
-                        if cmsg == EXITCMD:
-                            break
+                # Reception may have been stopped by a previous runner
+                self._transport.start(self._receive, self._deliver)
+            except usb1.USBErrorNoDevice:
+                return
+            try:
+                while self._transport.isRunning():
+                    self._handleEvents()
+                    if not self._sendPending():
+                        break
             except usb1.USBErrorInterrupted:
                 pass
 
-
     def handleEvents(self):
         """Fucntion to run in order to process usb events"""
-        if self._handle and self._ctx:
-            self._ctx.handleEvents()
+        if self._transport.isOpen():
+            self._handleEvents()
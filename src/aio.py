@@ -0,0 +1,207 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""asyncio front end for SteamController (python 3 only)"""
+
+import asyncio
+import select
+
+import usb1
+
+from steamcontroller import \
+    SteamController, \
+    EXITCMD, \
+    _feedbackMessage
+
+class AsyncSteamController(object):
+    """
+    Run a SteamController from an asyncio event loop.
+
+    libusb file descriptors are watched by the loop, so no thread is
+    blocked in SteamController.run(). Reports are read with:
+
+        async for sci in controller.reports():
+            ...
+
+    Must be created from a coroutine or callback of the running loop, and
+    only works with the usb transport.
+    """
+
+    def __init__(self, loop=None, maxsize=256, **kwargs):
+        """
+        Constructor
+
+        loop: asyncio loop, the running loop by default
+
+        maxsize: Number of reports kept while the consumer is late, the
+        oldest ones are dropped first
+
+        kwargs: Other arguments given to SteamController
+        """
+        self._loop = loop if loop is not None else asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+        self._fds = {}
+        self._wakeup = None
+        self._control = set()
+        self._done = False
+        self.dropped = 0
+
+        self._sc = SteamController(callback=self._onInput, **kwargs)
+        self._transport = self._sc._transport
+        self._ctx = self._transport._ctx
+
+        for fd, events in self._ctx.getPollFDList():
+            self._addFd(fd, events)
+        self._ctx.setPollFDNotifiers(self._onFdAdded, self._onFdRemoved)
+        self._rearm()
+
+    @property
+    def controller(self):
+        """Underlying SteamController"""
+        return self._sc
+
+    def _onFdAdded(self, fd, events, _):
+        self._addFd(fd, events)
+
+    def _onFdRemoved(self, fd, _):
+        self._removeFd(fd)
+
+    def _addFd(self, fd, events):
+        self._removeFd(fd)
+        if events & select.POLLIN:
+            self._loop.add_reader(fd, self._process)
+        if events & select.POLLOUT:
+            self._loop.add_writer(fd, self._process)
+        self._fds[fd] = events
+
+    def _removeFd(self, fd):
+        events = self._fds.pop(fd, 0)
+        if events & select.POLLIN:
+            self._loop.remove_reader(fd)
+        if events & select.POLLOUT:
+            self._loop.remove_writer(fd)
+
+    def _rearm(self):
+        """Wake the loop up at the next libusb or SteamController deadline"""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        timeouts = [x for x in (self._ctx.getNextTimeout(),
+                                self._sc._sched.timeout()) if x is not None]
+        if timeouts:
+            self._wakeup = self._loop.call_later(min(timeouts), self._process)
+
+    def _process(self):
+        if not self._transport.isOpen():
+            return
+        self._transport.handleEvents(0)
+        self._sc._sched.runPending()
+
+        # Control messages queued by callbacks (feedback, exit)
+        while len(self._sc._cmsg) > 0:
+            cmsg = self._sc._cmsg.pop()
+            self._submitControl(cmsg)
+            if cmsg == EXITCMD:
+                self._finish()
+
+        if not self._sc.isRunning():
+            self._finish()
+        self._rearm()
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self._push(None)
+
+    def _push(self, item):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(item)
+
+    def _onInput(self, _, sci):
+        self._push(sci)
+
+    def _submitControl(self, data, timeout=0):
+        future = self._loop.create_future()
+        transfer = self._transport.submitControl(data,
+                                                 self._onControlDone,
+                                                 future,
+                                                 timeout)
+        # Keep the transfer alive until completion
+        self._control.add(transfer)
+        return future
+
+    def _onControlDone(self, transfer):
+        self._control.discard(transfer)
+        future = transfer.getUserData()
+        if future.done():
+            return
+        status = transfer.getStatus()
+        if status == usb1.TRANSFER_COMPLETED:
+            future.set_result(None)
+        else:
+            future.set_exception(IOError('control transfer failed ({})'.format(status)))
+
+    async def reports(self):
+        """
+        Asynchronous iterator of SteamControllerInput, ends when the
+        controller exits or is unplugged
+        """
+        while True:
+            sci = await self._queue.get()
+            if sci is None:
+                return
+            yield sci
+
+    async def send_control(self, data, timeout=0):
+        """
+        Send a control message
+
+        @param bytes data       message, padded to 64 bytes
+        @param int timeout      timeout in ms, 0 for none
+        """
+        future = self._submitControl(data, timeout)
+        self._rearm()
+        await future
+
+    async def feedback(self, position, amplitude=128, period=0, count=1):
+        """
+        Play an haptic feedback, see SteamController.addFeedback
+        """
+        await self.send_control(_feedbackMessage(position, amplitude, period, count))
+
+    async def exit(self):
+        """Turn the controller off and end reports()"""
+        await self.send_control(EXITCMD)
+        self._finish()
+
+    def close(self):
+        """Stop watching libusb and release the controller"""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        self._ctx.setPollFDNotifiers()
+        for fd in list(self._fds):
+            self._removeFd(fd)
+        self._sc._close()
+        self._finish()
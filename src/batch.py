@@ -0,0 +1,124 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Batched delivery of reports as NumPy structured arrays (requires numpy)
+
+    sc = SteamController(callback=None)
+    batch = BatchCollector(sc, callback, size=64, period=0.1)
+    sc.run()
+
+callback(sc, reports, times) gets the reports as an array with one field
+per SteamControllerInput field (reports['gpitch'] is the column of gyro
+pitch values), and their monotonic reception times.
+"""
+
+import struct
+
+import numpy
+
+from steamcontroller import STEAM_CONTROLER_FORMAT
+from steamcontroller.recorder import REPORT_SIZE
+
+def _reportDtype():
+    names = []
+    formats = []
+    offsets = []
+    offset = 0
+    for fmt, name in STEAM_CONTROLER_FORMAT:
+        if not name.startswith('ukn_'):
+            names.append(name)
+            formats.append('<' + fmt)
+            offsets.append(offset)
+        offset += struct.calcsize('<' + fmt)
+    return numpy.dtype({
+        'names' : names,
+        'formats' : formats,
+        'offsets' : offsets,
+        'itemsize' : REPORT_SIZE,
+    })
+
+# Raw report viewed as a NumPy record, unknown bytes are skipped
+REPORT_DTYPE = _reportDtype()
+
+class BatchCollector(object):
+    """
+    Collect the raw reports of a SteamController and give them to a
+    callback by batch.
+
+    Every report is collected, whatever its status: filter them with
+    reports[reports['status'] == SCStatus.INPUT].
+    """
+
+    def __init__(self, sc, callback, size=64, period=None):
+        """
+        Constructor
+
+        sc: SteamController to collect reports from, it may be created
+        without callback
+
+        callback: function called with the SteamController, the reports
+        array and the times array of each batch
+
+        size: maximum number of reports in a batch
+
+        period: Optional maximum age in seconds of the first report of a
+        batch, partial batches are delivered when it expires
+        """
+        self._sc = sc
+        self._cb = callback
+        self._size = size
+        self._period = period
+        self._buf = bytearray(size * REPORT_SIZE)
+        self._times = numpy.zeros(size)
+        self._count = 0
+        self._timer = None
+        sc.addRawListener(self._onReport)
+
+    def _onReport(self, report, timestamp):
+        i = self._count
+        self._buf[i * REPORT_SIZE:(i + 1) * REPORT_SIZE] = report
+        self._times[i] = timestamp
+        self._count = i + 1
+        if self._count == self._size:
+            self.flush()
+        elif i == 0 and self._period is not None:
+            self._timer = self._sc._sched.schedule(self._period, self.flush)
+
+    def flush(self):
+        """Deliver pending reports now"""
+        if self._timer is not None:
+            self._sc._sched.cancel(self._timer)
+            self._timer = None
+        n = self._count
+        if n == 0:
+            return
+        self._count = 0
+        # Copies, the callback may keep them
+        reports = numpy.frombuffer(self._buf, REPORT_DTYPE, n).copy()
+        times = self._times[:n].copy()
+        self._cb(self._sc, reports, times)
+
+    def close(self):
+        """Deliver pending reports and stop collecting"""
+        self.flush()
+        self._sc.removeRawListener(self._onReport)
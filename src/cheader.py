@@ -23,11 +23,25 @@
 # THE SOFTWARE.
 
 import ast
+import hashlib
+import json
 import os
+import re
 import shlex
+import tempfile
 from collections import OrderedDict
 import operator as op
 
+# Bumped when the cache file content changes
+CACHE_VERSION = 1
+
+_COMMENT = re.compile(r'/\*.*?\*/|//[^\n]*', re.S)
+_DIRECTIVE = re.compile(r'^[ \t]*#[ \t]*(define|include)[ \t]+(.*)$', re.M)
+_DEFINE = re.compile(r'(\w+)(.*)$', re.S)
+_INCLUDE = re.compile(r'[<"]([^>"]+)[>"]')
+_TOKEN = re.compile(r'\w+|\S')
+_INT = re.compile(r'(?:0[xX][0-9a-fA-F]+|[1-9][0-9]*|0)$')
+
 OPERATORS = {
     ast.Add    : op.add,
     ast.Sub    : op.sub,
@@ -73,11 +87,69 @@ def eval_expr(expr):
     return _eval(ast.parse(expr, mode='eval').body)
 
 
-def defines(base, include):
+def _evaluate(tokens, out):
 
-    """ Extract #define from base/include following #includes """
+    """ Evaluate the tokens of a define, earlier defines are replaced by their
+    value. Return None when it is not an integer expression """
 
-    parsed = set()
+    expr = ''.join([str(out[tok]) if tok in out else tok for tok in tokens])
+    if _INT.match(expr):
+        return int(expr, 0)
+    try:
+        return eval_expr(expr)
+    except (SyntaxError, TypeError, KeyError, ZeroDivisionError):
+        return None
+
+
+def _parse(base, fname, parsed, out):
+
+    """ Add the object-like #define of fname to out, following #includes """
+
+    with open(fname) as f:
+        text = f.read()
+    text = _COMMENT.sub(' ', text.replace('\\\n', ' '))
+
+    for directive, rest in _DIRECTIVE.findall(text):
+        if directive == 'define':
+            m = _DEFINE.match(rest)
+            # Function-like macros are not constants
+            if m is None or m.group(2).startswith('('):
+                continue
+            val = _evaluate(_TOKEN.findall(m.group(2)), out)
+            if val is not None:
+                out[m.group(1)] = val
+        else:
+            m = _INCLUDE.match(rest.strip())
+            if m is None:
+                continue
+            name = os.path.normpath(os.path.abspath(os.path.join(base, m.group(1))))
+            if os.path.isfile(name) and not name in parsed:
+                parsed.add(name)
+                _parse(base, name, parsed, out)
+
+
+def defines(base, include, parsed=None):
+
+    """ Extract #define from base/include following #includes, the parsed
+    file names are added to the optional parsed set. Each value is computed
+    once, defines using earlier ones get their value. """
+
+    if parsed is None:
+        parsed = set()
+    fname = os.path.normpath(os.path.abspath(os.path.join(base, include)))
+    parsed.add(fname)
+
+    out = OrderedDict()
+    _parse(base, fname, parsed, out)
+    return out
+
+
+def defines_shlex(base, include, parsed=None):
+
+    """ Token by token version of defines(), slower, kept for reference """
+
+    if parsed is None:
+        parsed = set()
     fname = os.path.normpath(os.path.abspath(os.path.join(base, include)))
     parsed.add(fname)
 
@@ -185,6 +257,95 @@ def defines(base, include):
     return out
 
 
+def _cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'steamcontroller')
+
+
+def _file_hash(fname):
+    with open(fname, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _unchanged(entry):
+    """ Check a [path, mtime, hash] cache entry, the mtime is updated in
+    place when only the mtime changed """
+    fname, mtime, digest = entry
+    try:
+        st_mtime = os.stat(fname).st_mtime
+        if st_mtime == mtime:
+            return True
+        if _file_hash(fname) == digest:
+            entry[1] = st_mtime
+            return True
+    except (IOError, OSError):
+        pass
+    return False
+
+
+def _write_cache(cache_dir, path, cache):
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # Written aside then renamed, concurrent readers never see a partial file
+        fd, tmp = tempfile.mkstemp(prefix='.defines-', dir=cache_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cache, f)
+            os.rename(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+    except (IOError, OSError):
+        pass
+
+
+def cached_defines(base, include, cache_dir=None):
+
+    """ defines() kept in a cache file, checked against the path, mtime and
+    content hash of each parsed header. Headers are parsed again when one
+    changed or when the cache can not be read or written. Setting
+    STEAMCONTROLLER_NOCACHE in the environment disables the cache. """
+
+    if os.environ.get('STEAMCONTROLLER_NOCACHE'):
+        return defines(base, include)
+
+    fname = os.path.normpath(os.path.abspath(os.path.join(base, include)))
+    if cache_dir is None:
+        cache_dir = _cache_dir()
+    key = hashlib.sha1(fname.encode('utf-8')).hexdigest()[:16]
+    path = os.path.join(cache_dir, 'defines-{}.json'.format(key))
+
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+        mtimes = [x[1] for x in cache['files']]
+        if (cache['version'] == CACHE_VERSION and cache['header'] == fname and
+                all(_unchanged(x) for x in cache['files'])):
+            # Touched headers would be hashed again on each load
+            if [x[1] for x in cache['files']] != mtimes:
+                _write_cache(cache_dir, path, cache)
+            return OrderedDict(cache['defines'])
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+
+    parsed = set()
+    out = defines(base, include, parsed)
+
+    try:
+        cache = {
+            'version' : CACHE_VERSION,
+            'header' : fname,
+            'files' : [[x, os.stat(x).st_mtime, _file_hash(x)] for x in sorted(parsed)],
+            'defines' : list(out.items()),
+        }
+    except (IOError, OSError):
+        return out
+    _write_cache(cache_dir, path, cache)
+
+    return out
+
+
 if __name__ == '__main__':
     import sys
     definesDict = defines(sys.argv[1], sys.argv[2])
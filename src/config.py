@@ -23,12 +23,20 @@
 
 import json
 import os
+import select
 import shlex
+import threading
+import weakref
 
 from steamcontroller import SCButtons
 from steamcontroller.events import EventMapper, Modes, StickModes, PadModes, Pos, TrigModes
+from steamcontroller.inotify import Inotify
+from steamcontroller.tools import monotonic
 from steamcontroller.uinput import Axes, Keys, Scans
 
+# Seconds between checks that the watched EventMapper is still used
+WATCH_PERIOD = 1.0
+
 def vdf2json(stream): # {{{
 	"""
 	Read a Steam vdf file and return a string in json format
@@ -352,9 +360,20 @@ class Configurator():
 	product = 0x1142
 	version = 0x1
 
-	def __init__(self, name, vdf_path = None, vendor = 0x28de, product = 0x1142, version = 0x1): # {{{
+	# Create the uinput devices with the EventMapper (see EventMapper.createDevices)
+	eager = False
+
+	# Optional DevicePool, devices are kept when the EventMapper is generated again
+	pool = None
+
+	# ConfigWatcher started by watch()
+	watcher = None
+
+	def __init__(self, name, vdf_path = None, vendor = 0x28de, product = 0x1142, version = 0x1, eager = False, pool = None): # {{{
 		self.name = name
 		self.vdf_path = vdf_path
+		self.eager = eager
+		self.pool = pool
 		if(self.vdf_path != None):
 			self.load_config()
 		self.vendor = vendor
@@ -362,6 +381,17 @@ class Configurator():
 		self.version = version
 	# }}}
 
+	def watch(self): # {{{
+		"""
+		Reload the VDF file in the running EventMapper each time it is
+		saved, see ConfigWatcher
+		"""
+		assert self.vdf_path != None and self.evm != None
+		self.watcher = ConfigWatcher(self.evm, self.name, self.vdf_path, self.vendor, self.product, self.version)
+		self.watcher.start()
+		return self.watcher
+	# }}}
+
 	def load_config(self): # {{{
 		self.import_config(parse_config(load_vdf(self.vdf_path)))
 	# }}}
@@ -385,7 +415,9 @@ class Configurator():
 
 	def generate_eventmapper(self): # {{{
 		assert self.config != None
-		self.evm = EventMapper(gamepad_definition = self.generate_gamepad_definition(), modes = self.get_modes())
+		if(self.evm != None):
+			self.evm.releaseDevices()
+		self.evm = EventMapper(gamepad_definition = self.generate_gamepad_definition(), modes = self.get_modes(), eager = self.eager, pool = self.pool)
 
 		if('left_trackpad' in self.config and 'active' in self.config['left_trackpad']):
 			self.set_trackpad_config(Pos.LEFT, 'active')
@@ -424,7 +456,7 @@ class Configurator():
 		name = self.name + ((' [' + os.path.basename(self.vdf_path) + ']') if self.vdf_path != None else '')
 		try:
 			# In python3, we need to do this to get a string of 8-bit chars
-			return bytes(name)
+			return bytes(name, 'utf-8')
 		except TypeError:
 			# But in python2, str consists of 8-bit chars; it's the unicode type
 			#    that consists of wide chars
@@ -542,3 +574,74 @@ class Configurator():
 			self.evm.setTrigButton(pos, group['buttons']['click'])
 	# }}}
 
+class ConfigWatcher(threading.Thread): # {{{
+	"""
+	Thread reloading a VDF file when it is saved.  The file is parsed and a
+	new EventMapper configured here, off the input path, then its mapping
+	is queued to the running EventMapper which takes it before its next
+	report (see EventMapper.queueMapping).  Its devices are kept when the
+	definition did not change.  A file that fails to load leaves the
+	running mapping as it is.
+
+	Only a weak reference to the running EventMapper is kept, the thread
+	ends once it is deleted.
+	"""
+
+	def __init__(self, evm, name, vdf_path, vendor = 0x28de, product = 0x1142, version = 0x1): # {{{
+		threading.Thread.__init__(self, name = 'ConfigWatcher')
+		self.daemon = True
+		self.evm = weakref.ref(evm)
+		self.device_name = name
+		self.vdf_path = os.path.abspath(vdf_path)
+		self.vendor = vendor
+		self.product = product
+		self.version = version
+
+		# Reloads done, and duration of the last one from the file event
+		#    to the queued mapping
+		self.reloads = 0
+		self.latency = None
+
+		self.inotify = Inotify()
+		self.inotify.addWatch(os.path.dirname(self.vdf_path))
+	# }}}
+
+	def run(self): # {{{
+		basename = os.path.basename(self.vdf_path)
+		try:
+			while self.evm() != None:
+				ready = select.select([self.inotify], [], [], WATCH_PERIOD)[0]
+				if(not ready):
+					continue
+				start = monotonic()
+				if(basename in self.inotify.readNames()):
+					self.reload(start)
+		finally:
+			self.inotify.close()
+	# }}}
+
+	def reload(self, start = None): # {{{
+		if(start == None):
+			start = monotonic()
+		try:
+			staging = Configurator(self.device_name, self.vdf_path, self.vendor, self.product, self.version)
+		except Exception as e:
+			print('--- Failed to reload {}: {!r}'.format(self.vdf_path, e))
+			return False
+
+		evm = self.evm()
+		if(evm == None):
+			return False
+
+		# Modeshift callbacks of the new mapping configure staging.evm, point
+		#    it to the running EventMapper which takes the mapping
+		mapping = staging.evm
+		staging.evm = evm
+		evm.queueMapping(mapping)
+
+		self.reloads += 1
+		self.latency = monotonic() - start
+		print('--- Reloaded {} in {:.1f} ms'.format(self.vdf_path, self.latency * 1000))
+		return True
+	# }}}
+# }}}
@@ -0,0 +1,119 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""Control message queue"""
+
+from collections import deque, OrderedDict
+
+# Maximum number of pending configuration messages
+CONFIG_MAXLEN = 32
+
+class ControlQueue(object):
+    """
+    Bounded queue of control messages to send to the controller.
+
+    Messages are popped by priority: exit first, then configuration messages
+    in order, then haptic pulses. At most one haptic pulse is kept per
+    actuator, a new pulse replaces the one still pending on the same pad, so
+    pulses generated on every tick can not pile up.
+    """
+
+    def __init__(self, exitcmd, config_maxlen=CONFIG_MAXLEN):
+        """
+        Constructor
+
+        @param bytes exitcmd        exit message
+        @param int config_maxlen    maximum number of pending configuration
+                                    messages, the oldest ones are dropped
+        """
+        self._exitcmd = exitcmd
+        self._exit = False
+        self._config = deque()
+        self._config_maxlen = config_maxlen
+        self._haptic = OrderedDict()
+        self._stats = {
+            'sent'    : 0,
+            'merged'  : 0,
+            'dropped' : 0,
+        }
+
+    def __len__(self):
+        return int(self._exit) + len(self._config) + len(self._haptic)
+
+    def addExit(self):
+        """Queue the exit message"""
+        self._exit = True
+
+    def addConfig(self, data):
+        """
+        Queue a configuration message
+
+        @param bytes data       control message
+        """
+        if len(self._config) >= self._config_maxlen:
+            self._config.popleft()
+            self._stats['dropped'] += 1
+        self._config.append(data)
+
+    def addHaptic(self, position, data):
+        """
+        Queue an haptic pulse, replacing the pending one of this actuator
+
+        @param int position     actuator (HapticPos)
+        @param bytes data       control message
+        """
+        if position in self._haptic:
+            self._stats['merged'] += 1
+        self._haptic[position] = data
+
+    def pop(self):
+        """
+        Get the next message to send
+
+        @return bytes           message or None when empty
+        """
+        if self._exit:
+            self._exit = False
+            data = self._exitcmd
+        elif len(self._config) > 0:
+            data = self._config.popleft()
+        elif len(self._haptic) > 0:
+            _, data = self._haptic.popitem(last=False)
+        else:
+            return None
+        self._stats['sent'] += 1
+        return data
+
+    def getStats(self):
+        """
+        Get queue counters
+
+        depth:   messages pending
+        sent:    messages popped to be sent
+        merged:  haptic pulses replaced before being sent
+        dropped: configuration messages dropped on overflow
+
+        @return dict            copy of the counters
+        """
+        stats = dict(self._stats)
+        stats['depth'] = len(self)
+        return stats
@@ -38,11 +38,25 @@ from steamcontroller import \
     SCI_NULL
 
 import steamcontroller.uinput as sui
+from steamcontroller.tools import monotonic
 
 from collections import deque
 
 EXIT_PRESS_DURATION = 2.0
 
+# SteamControllerInput fields read by EventMapper.process
+FIELDS = ('status', 'buttons', 'ltrig', 'rtrig',
+          'lpad_x', 'lpad_y', 'rpad_x', 'rpad_y')
+
+# EventMapper attributes set by the configuration methods, taken from
+# another mapper by EventMapper.queueMapping
+MAPPING = ('_btn_map',
+           '_pad_modes', '_pad_dzones', '_pad_evts', '_pad_revs',
+           '_trig_modes', '_trig_evts', '_trig_axes_callbacks',
+           '_stick_mode', '_stick_evts', '_stick_rev',
+           '_stick_axes_callback', '_stick_pressed_callback',
+           '_mouse_params', '_scroll_params')
+
 class Pos(IntEnum):
     """Specify witch pad or trig is used"""
     RIGHT = 0
@@ -82,7 +96,23 @@ class EventMapper(object):
     callback to be registered to a SteamController instance
     """
 
-    def __init__(self, gamepad_definition = None, modes = [Modes.GAMEPAD, Modes.MOUSE, Modes.KEYBOARD]):
+    def __init__(self, gamepad_definition = None, modes = [Modes.GAMEPAD, Modes.MOUSE, Modes.KEYBOARD],
+                 eager = False, pool = None):
+        """
+        Constructor
+
+        gamepad_definition: Optional Gamepad device description (see
+        uinput.Gamepad)
+
+        modes: Devices to create
+
+        eager: Create the devices now and wait until they are registered
+        (see createDevices), instead of at their first event
+
+        pool: Optional DevicePool the devices are borrowed from, and given
+        back to when the mapper is deleted (see releaseDevices)
+        """
+        self._pool = pool
         self._uip = {}
         if(Modes.GAMEPAD in modes):
             self._uip[Modes.GAMEPAD] = sui.Gamepad(gamepad_definition)
@@ -90,6 +120,9 @@ class EventMapper(object):
             self._uip[Modes.KEYBOARD] = sui.Keyboard()
         if(Modes.MOUSE in modes):
             self._uip[Modes.MOUSE] = sui.Mouse()
+        if pool is not None:
+            for mode in self._uip:
+                self._uip[mode] = pool.borrow(self._uip[mode])
 
         self._btn_map = {x : (None, 0) for x in list(SCButtons)}
 
@@ -105,6 +138,9 @@ class EventMapper(object):
         self._stick_evts = [(None, 0)]*2
         self._stick_rev = False
 
+        self._mouse_params = {}
+        self._scroll_params = {}
+
         self._sci_prev = SCI_NULL
 
         self._xdq = [deque(maxlen=8), deque(maxlen=8)]
@@ -126,11 +162,37 @@ class EventMapper(object):
         self._moved = [0, 0]
         self._steam_pressed_time = 0.0
 
+        self._prof = None
+        self._reports = 0
+        self._first_latency = None
+
+        # Queued mapping, appending replaces it atomically
+        self._pending = deque(maxlen=1)
+        self._swaps = 0
+        self._swap_time = None
+
+        # Counters of the devices when this mapper got them, pooled devices
+        #    keep the counts of their previous users
+        self._stats_base = {mode : uip.getStats() for mode, uip in self._uip.items()}
+        self._stats_gone = {}
+
+        if eager:
+            self.createDevices()
+
     def __del__(self):
-        if hasattr(self, '_uip') and self._uip:
-            for u in self._uip:
-                del u
-            self._uip = []
+        if hasattr(self, '_uip'):
+            self.releaseDevices()
+
+    def releaseDevices(self):
+        """
+        Give the devices back to the pool, with keys released and axes
+        centered. Without pool they are destroyed once no longer used. The
+        mapper can not process inputs anymore.
+        """
+        if self._pool is not None:
+            for uip in self._uip.values():
+                self._pool.release(uip)
+        self._uip = {}
 
     def process(self, sc, sci):
         """
@@ -142,6 +204,16 @@ class EventMapper(object):
 
         if sci.status != SCStatus.INPUT:
             return
+        if self._pending:
+            self._swapMapping()
+        self._reports += 1
+        first = self._first_latency is None
+        if first:
+            start = monotonic()
+
+        prof = self._prof
+        if prof is not None:
+            prof.mark()
 
         sci_p = self._sci_prev
         self._sci_prev = sci
@@ -226,6 +298,8 @@ class EventMapper(object):
                         ev(self, btn, False)
                     else:
                         _keyreleased(mode, ev)
+        if prof is not None:
+            prof.lap('buttons')
         # }}}
 
         # Manage pads {{{
@@ -407,6 +481,13 @@ class EventMapper(object):
                 xm_p, ym_p, xm, ym = 0, 0, 0, 0
                 self._xdq[pos].clear()
                 self._ydq[pos].clear()
+
+        # Free trackballs keep rolling between reports
+        inertia = self._getInertia()
+        if inertia > 0.0:
+            sc.addTicks(self.tick, inertia)
+        if prof is not None:
+            prof.lap('pads')
         # }}}
 
         # Manage Trig {{{
@@ -427,6 +508,8 @@ class EventMapper(object):
                 elif self._trig_s[pos] is not None and trigval <= self._trig_s[pos]:
                     self._trig_s[pos] = None
                     _keyreleased(mode, ev)
+        if prof is not None:
+            prof.lap('triggers')
         # }}}
 
         # Manage Stick {{{
@@ -487,6 +570,8 @@ class EventMapper(object):
             if sci.buttons & SCButtons.LPAD == SCButtons.LPAD:
                 if self._stick_pressed_callback is not None:
                     self._stick_pressed_callback(self)
+        if prof is not None:
+            prof.lap('stick')
         # }}}
 
         if len(_pressed):
@@ -498,6 +583,192 @@ class EventMapper(object):
         for i in list(syn):
             self._uip[i].synEvent()
 
+        if first and self._deviceStats()['frames']:
+            self._first_latency = monotonic() - start
+
+        if prof is not None:
+            prof.lap('uinput')
+            prof.end()
+
+
+    def tick(self, sc):
+        """
+        Roll the free trackballs without a new report, only the mouse and
+        scroll integration of process is done
+
+        @param SteamController sc       steamcontroller class used to get input
+
+        @return float           time left in seconds before the trackballs stop
+        """
+        buttons = self._sci_prev.buttons
+        for pos, touch in ((Pos.LEFT, SCButtons.LPADTOUCH),
+                           (Pos.RIGHT, SCButtons.RPADTOUCH)):
+            if buttons & touch == touch:
+                continue
+            if self._pad_modes[pos] == PadModes.MOUSE:
+                self._moved[pos] += int(self._uip[Modes.MOUSE].moveEvent(0, 0, True))
+                self._moved[pos] %= 4000
+            elif self._pad_modes[pos] == PadModes.MOUSESCROLL:
+                self._uip[Modes.MOUSE].scrollEvent(0, 0, True)
+        return self._getInertia()
+
+    def _getInertia(self):
+        """Get the time left before the untouched trackball pads stop"""
+        inertia = 0.0
+        buttons = self._sci_prev.buttons
+        for pos, touch in ((Pos.LEFT, SCButtons.LPADTOUCH),
+                           (Pos.RIGHT, SCButtons.RPADTOUCH)):
+            if buttons & touch == touch:
+                continue
+            if self._pad_modes[pos] == PadModes.MOUSE:
+                inertia = max(inertia, self._uip[Modes.MOUSE].getMoveInertia())
+            elif self._pad_modes[pos] == PadModes.MOUSESCROLL:
+                inertia = max(inertia, self._uip[Modes.MOUSE].getScrollInertia())
+        return inertia
+
+    def queueMapping(self, other):
+        """
+        Take the mapping of another EventMapper before the next report, to
+        change profile without stopping the controller. The other mapper is
+        configured as usual but should be built without eager nor pool, its
+        devices are only used for their definition. Can be called from
+        another thread, the last queued mapping wins.
+
+        @param EventMapper other        mapper giving the new mapping
+        """
+        self._pending.append(other)
+
+    def _swapMapping(self):
+        """
+        Replace the mapping by the queued one: held keys are released and
+        axes centered, devices with the same definition are kept, the
+        others are exchanged through the pool
+        """
+        start = monotonic()
+        try:
+            other = self._pending.pop()
+        except IndexError:
+            return
+
+        for uip in self._uip.values():
+            uip.reset()
+
+        for mode in set(self._uip) | set(other._uip):
+            mine = self._uip.get(mode)
+            theirs = other._uip.get(mode)
+            if mine is not None and theirs is not None and \
+               mine.getDefinition() == theirs.getDefinition():
+                continue
+            if mine is not None:
+                base = self._stats_base.pop(mode)
+                for key, val in mine.getStats().items():
+                    self._stats_gone[key] = self._stats_gone.get(key, 0) + val - base[key]
+                if self._pool is not None:
+                    self._pool.release(mine)
+            if theirs is None:
+                del self._uip[mode]
+                continue
+            if self._pool is not None:
+                self._uip[mode] = self._pool.borrow(theirs)
+            else:
+                self._uip[mode] = theirs
+            self._stats_base[mode] = self._uip[mode].getStats()
+        other._uip = {}
+
+        for attr in MAPPING:
+            setattr(self, attr, getattr(other, attr))
+
+        if Modes.MOUSE in self._uip:
+            self._uip[Modes.MOUSE].updateParams(**self._mouse_params)
+            self._uip[Modes.MOUSE].updateScrollParams(**self._scroll_params)
+
+        self._sci_prev = SCI_NULL
+        self._xdq = [deque(maxlen=8), deque(maxlen=8)]
+        self._ydq = [deque(maxlen=8), deque(maxlen=8)]
+        self._onkeys = set()
+        self._onabs = {}
+        self._stick_tys = None
+        self._stick_lxs = None
+        self._stick_bys = None
+        self._stick_rxs = None
+        self._trig_s = [None, None]
+        self._moved = [0, 0]
+
+        self._swaps += 1
+        self._swap_time = monotonic() - start
+
+    def getFields(self):
+        """
+        Get the SteamControllerInput fields read by process, the others
+        do not need to be decoded
+
+        @return tuple           field names
+        """
+        return FIELDS
+
+    def createDevices(self, timeout=sui.READY_TIMEOUT):
+        """
+        Create the uinput devices now instead of at their first event, and
+        wait until their evdev nodes appear. Otherwise the first input pays
+        for the creation, and is often lost while the device is registered.
+
+        @param float timeout    maximum wait in seconds
+
+        @return bool            False when a node did not appear in time
+        """
+        for uip in self._uip.values():
+            uip.createDevice()
+        deadline = monotonic() + timeout
+        ready = True
+        for uip in self._uip.values():
+            ready &= uip.waitReady(max(0.0, deadline - monotonic()))
+        return ready
+
+    def getStats(self):
+        """
+        Get the uinput counters of all devices since this mapper got them
+        (see UInput.getStats), with
+        the processed reports, the write syscalls by report, and the
+        processing time of the first report with output (including device
+        creation when it was not done before), None until then, and the
+        mapping swaps with the duration of the last one (see queueMapping)
+
+        @return dict            counters by name
+        """
+        stats = {'reports' : self._reports}
+        stats.update(self._deviceStats())
+        if self._reports:
+            stats['writes_per_report'] = float(stats['writes']) / self._reports
+        else:
+            stats['writes_per_report'] = 0.0
+        stats['first_input_latency'] = self._first_latency
+        stats['mapping_swaps'] = self._swaps
+        stats['swap_time'] = self._swap_time
+        return stats
+
+    def _deviceStats(self):
+        """Sum the device counters since the devices were given to this mapper"""
+        stats = {
+            'events' : 0,
+            'frames' : 0,
+            'writes' : 0,
+            'create_time' : 0.0,
+        }
+        for key, val in self._stats_gone.items():
+            stats[key] += val
+        for mode, uip in self._uip.items():
+            base = self._stats_base[mode]
+            for key, val in uip.getStats().items():
+                stats[key] += val - base[key]
+        return stats
+
+    def setProfiler(self, profiler):
+        """
+        Time the mapping stages of each report, None to stop
+
+        @param LatencyProfiler profiler     see steamcontroller.profiler
+        """
+        self._prof = profiler
 
     def setButtonAction(self, btn, key_event, mode = None):
         if(key_event == None and btn in self._btn_map):
@@ -616,7 +887,8 @@ class EventMapper(object):
                     yscale=sui.Mouse.DEFAULT_XSCALE):
         if not trackball:
             friction = 100.0
-        self._uip[Modes.MOUSE].updateParams(friction=friction, xscale=xscale, yscale=yscale)
+        self._mouse_params = dict(friction=friction, xscale=xscale, yscale=yscale)
+        self._uip[Modes.MOUSE].updateParams(**self._mouse_params)
         self._pad_modes[pos] = PadModes.MOUSE
 
 
@@ -627,7 +899,8 @@ class EventMapper(object):
                      yscale=sui.Mouse.DEFAULT_SCR_XSCALE):
         if not trackball:
             friction = 100.0
-        self._uip[Modes.MOUSE].updateScrollParams(friction=friction, xscale=xscale, yscale=yscale)
+        self._scroll_params = dict(friction=friction, xscale=xscale, yscale=yscale)
+        self._uip[Modes.MOUSE].updateScrollParams(**self._scroll_params)
         self._pad_modes[pos] = PadModes.MOUSESCROLL
 
     def setPadAxes(self, pos, abs_x_event, abs_y_event, revert=True):
@@ -0,0 +1,265 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""Drive all steam controllers of the host from one process"""
+
+from collections import OrderedDict
+
+import usb1
+
+from steamcontroller import \
+    SteamController, \
+    SCInterface, \
+    VENDOR_ID, \
+    PRODUCT_ID, \
+    ENDPOINT, \
+    CONTROLIDX, \
+    TRANSFERS
+from steamcontroller.scheduler import Scheduler
+from steamcontroller.transport import USBTransport, handleEvents
+
+class SteamControllerHub(object):
+    """
+    Claim every free controller interface of every attached wired
+    controller or wireless dongle on a single usb context, and run them all
+    from one event loop. Each controller gets its own callback, created by
+    callback_factory, so each one can be routed to its own EventMapper.
+
+    With hotplug enabled, devices are claimed as soon as they are plugged
+    and released when unplugged. The callback of an unplugged controller is
+    kept and given to the next controller that appears, so its EventMapper
+    and uinput devices stay in place.
+    """
+
+    def __init__(self, callback_factory, callback_args=None, transfers=TRANSFERS,
+                 hotplug=False, limit=None, profiler=None, settings=None,
+                 index=None):
+        """
+        Constructor
+
+        callback_factory: function without argument called once per claimed
+        controller, returns the callback of this controller (see
+        SteamController)
+
+        callback_args: Optional arguments passed to the callbacks afer the
+        SteamControllerInput argument
+
+        transfers: Number of interrupt transfers kept in flight per
+        controller
+
+        hotplug: Follow device arrival and removal, no error is raised when
+        no device is present (ignored if libusb has no hotplug support)
+
+        limit: Maximum number of controllers to claim, None for all
+
+        profiler: Optional LatencyProfiler shared by all controllers
+
+        settings: Optional Settings applied to every controller (see
+        SteamController)
+
+        index: Optional controller to claim on each device, 0 for a wired
+        controller, 0 to 3 for the controllers of a wireless dongle, None
+        for all
+        """
+        self._factory = callback_factory
+        self._cb_args = callback_args
+        self._transfers = transfers
+        self._limit = limit
+        self._index = index
+        self._prof = profiler
+        self._settings = settings
+
+        self._ctx = usb1.USBContext()
+        self._sched = Scheduler()
+        self._devices = {}
+        self._controllers = OrderedDict()
+        self._callbacks = {}
+        self._idle_callbacks = []
+        self._hotplug_events = []
+        self._hotplug = None
+
+        if hotplug and self._ctx.hasCapability(usb1.CAP_HAS_HOTPLUG):
+            # Already plugged devices are reported at registration
+            self._hotplug = self._ctx.hotplugRegisterCallback(
+                self._onHotplug,
+                vendor_id=VENDOR_ID,
+            )
+            self._handleHotplugEvents()
+        else:
+            for dev in self._ctx.getDeviceIterator(skip_on_error=True):
+                self._attach(dev)
+
+            if len(self._controllers) == 0:
+                raise ValueError('No SteamControler Device found')
+
+    @staticmethod
+    def _deviceKey(dev):
+        return '{:03d}:{:03d}'.format(dev.getBusNumber(), dev.getDeviceAddress())
+
+    def _full(self):
+        return self._limit is not None and len(self._controllers) >= self._limit
+
+    def _onHotplug(self, ctx, dev, event):
+        # libusb forbids synchronous calls from here, defer to the event loop
+        self._hotplug_events.append((dev, event))
+        return False
+
+    def _handleHotplugEvents(self):
+        while len(self._hotplug_events) > 0:
+            dev, event = self._hotplug_events.pop(0)
+            if event == usb1.HOTPLUG_EVENT_DEVICE_ARRIVED:
+                self._attach(dev)
+            else:
+                self._detach(dev)
+
+    def _attach(self, dev):
+        """Claim free controller interfaces of a device"""
+
+        pid = dev.getProductID()
+        if dev.getVendorID() != VENDOR_ID or pid not in PRODUCT_ID:
+            return
+        devkey = self._deviceKey(dev)
+        if devkey in self._devices or self._full():
+            return
+
+        try:
+            handle = dev.open()
+            for inter in dev[0]:
+                for setting in inter:
+                    number = setting.getNumber()
+                    if handle.kernelDriverActive(number):
+                        handle.detachKernelDriver(number)
+        except usb1.USBError:
+            return
+
+        for i in range(len(PRODUCT_ID)):
+            if PRODUCT_ID[i] != pid:
+                continue
+            if self._index is not None and PRODUCT_ID[:i].count(pid) != self._index:
+                continue
+            if self._full():
+                break
+
+            number = CONTROLIDX[i]
+            key = '{}:{:d}'.format(devkey, number)
+            if len(self._idle_callbacks) > 0:
+                callback = self._idle_callbacks.pop(0)
+            else:
+                callback = self._factory()
+
+            try:
+                handle.claimInterface(number)
+                transport = USBTransport(self._ctx,
+                                         SCInterface(handle,
+                                                     pid,
+                                                     ENDPOINT[i],
+                                                     CONTROLIDX[i],
+                                                     number),
+                                         self._transfers)
+                sc = SteamController(callback,
+                                     self._cb_args,
+                                     transport=transport,
+                                     scheduler=self._sched,
+                                     profiler=self._prof,
+                                     settings=self._settings)
+            except usb1.USBError:
+                # Busy or gone while being initialized
+                self._idle_callbacks.insert(0, callback)
+                try:
+                    handle.releaseInterface(number)
+                except usb1.USBError:
+                    pass
+                continue
+
+            self._controllers[key] = sc
+            self._callbacks[key] = callback
+
+        if any(k.startswith(devkey + ':') for k in self._controllers):
+            self._devices[devkey] = handle
+        else:
+            handle.close()
+
+    def _detach(self, dev):
+        """Forget controllers of an unplugged device"""
+
+        devkey = self._deviceKey(dev)
+        handle = self._devices.pop(devkey, None)
+        if handle is None:
+            return
+
+        for key in [k for k in self._controllers if k.startswith(devkey + ':')]:
+            self._controllers.pop(key)._detach()
+            self._idle_callbacks.append(self._callbacks.pop(key))
+        handle.close()
+
+    def _close(self):
+        if self._hotplug is not None:
+            self._ctx.hotplugDeregisterCallback(self._hotplug)
+            self._hotplug = None
+        for sc in self._controllers.values():
+            sc._close()
+        self._controllers.clear()
+        for handle in self._devices.values():
+            handle.resetDevice()
+            handle.close()
+        self._devices.clear()
+
+    def __del__(self):
+        self._close()
+
+    def controllers(self):
+        """
+        Get claimed controllers
+
+        @return OrderedDict     SteamController by 'bus:address:interface' key
+        """
+        return self._controllers
+
+    def getStats(self):
+        """
+        Get usb reception counters of each controller
+
+        @return dict            SteamController.getStats() by controller key
+        """
+        return {key : sc.getStats() for key, sc in self._controllers.items()}
+
+    def run(self):
+        """
+        Fucntion to run in order to process usb events of all controllers.
+        With hotplug it only returns when interrupted.
+        """
+        try:
+            while (self._hotplug is not None or
+                   any(sc.isRunning() for sc in self._controllers.values())):
+                handleEvents(self._ctx, self._sched.timeout())
+                self._sched.runPending()
+                self._handleHotplugEvents()
+                for sc in list(self._controllers.values()):
+                    # On exit the controller turns off, keep its interface
+                    # claimed to get it back when it is switched on again
+                    try:
+                        sc._sendPending()
+                    except usb1.USBErrorNoDevice:
+                        # Unplugged, the hotplug event is not handled yet
+                        pass
+        except usb1.USBErrorInterrupted:
+            pass
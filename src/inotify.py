@@ -0,0 +1,139 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+"""
+Minimal inotify binding to watch files through their directory
+
+Editors either rewrite a file in place or write a new one and rename it
+over the old, watching the directory for close after write and moves into
+it catches both, where a watch on the file itself would be lost on the
+first rename.
+
+    watch = Inotify()
+    watch.addWatch(os.path.dirname(path))
+    select.select([watch], [], [])
+    names = watch.readNames()
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO    = 0x00000080
+IN_IGNORED     = 0x00008000
+
+IN_CLOEXEC     = 0o2000000
+IN_NONBLOCK    = 0o0004000
+
+# Events when a file of the directory gets its new content
+IN_WRITTEN = IN_CLOSE_WRITE | IN_MOVED_TO
+
+# struct inotify_event without the trailing name
+INOTIFY_EVENT = struct.Struct('iIII')
+
+# Room for a few events with their name
+READ_SIZE = 64 * (INOTIFY_EVENT.size + 256)
+
+def _libc():
+    """Load the C library, with errno saved on each call"""
+    return ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+
+class Inotify(object):
+    """
+    Non blocking inotify instance, usable with select by its fileno
+    """
+
+    def __init__(self):
+        self._lib = _libc()
+        self._lib.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = self._lib.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches = {}
+
+    def __del__(self):
+        self.close()
+
+    def fileno(self):
+        """@return int           inotify file descriptor"""
+        return self._fd
+
+    def addWatch(self, path, mask=IN_WRITTEN):
+        """
+        Watch a file or directory
+
+        @param str path         watched path
+        @param int mask         IN_* events to report
+
+        @return int             watch descriptor
+        """
+        wd = self._lib.inotify_add_watch(self._fd, path.encode('utf-8'), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self._watches[wd] = path
+        return wd
+
+    def readEvents(self):
+        """
+        Read the pending events without blocking
+
+        @return list            (watched path, mask, name) tuples, name is
+                                empty for events on the watched path itself
+        """
+        events = []
+        while True:
+            try:
+                buf = os.read(self._fd, READ_SIZE)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return events
+                raise
+            off = 0
+            while off < len(buf):
+                wd, mask, _, size = INOTIFY_EVENT.unpack_from(buf, off)
+                off += INOTIFY_EVENT.size
+                name = buf[off:off + size].rstrip(b'\0').decode('utf-8', 'replace')
+                off += size
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                events.append((self._watches.get(wd), mask, name))
+
+    def readNames(self):
+        """
+        Read the pending events without blocking
+
+        @return set             names of the files events were reported on
+        """
+        return set(name for _, _, name in self.readEvents())
+
+    def close(self):
+        """Close the inotify instance, all watches are removed"""
+        if getattr(self, '_fd', -1) >= 0:
+            os.close(self._fd)
+            self._fd = -1
@@ -0,0 +1,176 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Latency histograms of the input pipeline
+
+A LatencyProfiler given to SteamController and EventMapper measures each
+report from usb completion to the last uinput syn, and the time spent in
+each stage on the way. Durations are counted in fixed buckets, so
+recording costs the same whatever the number of reports.
+"""
+
+from bisect import bisect_left
+import signal
+import sys
+
+from steamcontroller.tools import monotonic
+
+# Upper bounds of histogram buckets in seconds, the last bucket is unbounded
+BUCKETS = [x * 1e-6 for x in (1, 2, 5, 10, 20, 50, 100, 200, 500,
+                              1000, 2000, 5000, 10000, 20000, 50000)]
+
+# decode: usb report to SteamControllerInput
+# buttons, pads, triggers, stick: EventMapper stages, including the uinput
+#   events they generate
+# uinput: keyboard events and syn of all modified devices
+# total: usb completion to last syn
+STAGES = ('decode', 'buttons', 'pads', 'triggers', 'stick', 'uinput', 'total')
+
+class Histogram(object):
+    """Fixed buckets duration histogram"""
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.counts[bisect_left(self.bounds, duration)] += 1
+        self.count += 1
+        self.sum += duration
+        if duration > self.max:
+            self.max = duration
+
+    def percentile(self, p):
+        """
+        Get the upper bound of the bucket holding a percentile
+
+        @param float p          percentile from 0 to 100
+
+        @return float           duration in seconds, max for the last bucket
+        """
+        if self.count == 0:
+            return 0.0
+        rank = p * self.count / 100.0
+        acc = 0
+        for i, n in enumerate(self.counts):
+            acc += n
+            if acc >= rank and n:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+
+class LatencyProfiler(object):
+    """
+    Stage durations of the input pipeline, see STAGES.
+
+    One profiler can be shared by all controllers of a process, reports are
+    delivered one at a time from the event loop.
+    """
+
+    def __init__(self, bounds=BUCKETS):
+        self._hist = {stage : Histogram(bounds) for stage in STAGES}
+        self._start = None
+        self._lap = 0.0
+
+    def add(self, stage, duration):
+        self._hist[stage].add(duration)
+
+    def begin(self, stamp):
+        """
+        Start the measure of a report
+
+        @param float stamp      monotonic usb completion time of the report
+        """
+        self._start = stamp
+
+    def mark(self):
+        """Start timing a stage"""
+        self._lap = monotonic()
+
+    def lap(self, stage):
+        """Record the time since the last mark or lap, and start the next stage"""
+        now = monotonic()
+        self._hist[stage].add(now - self._lap)
+        self._lap = now
+
+    def end(self):
+        """End the measure of the current report, once its events are sent"""
+        if self._start is not None:
+            self._hist['total'].add(monotonic() - self._start)
+            self._start = None
+
+    def reset(self):
+        for hist in self._hist.values():
+            hist.reset()
+
+    def getHistograms(self):
+        """
+        @return dict            Histogram by stage name
+        """
+        return self._hist
+
+    def dump(self, out=None):
+        """
+        Write a summary and the bucket counts of every stage
+
+        @param file out         output, sys.stderr by default
+        """
+        out = out if out is not None else sys.stderr
+        bounds = self._hist['total'].bounds
+        out.write('{:8s} {:>8s} {:>9s} {:>9s} {:>9s} {:>9s}\n'.format(
+            'stage', 'count', 'mean(us)', 'p50(us)', 'p99(us)', 'max(us)'))
+        for stage in STAGES:
+            h = self._hist[stage]
+            out.write('{:8s} {:8d} {:9.1f} {:9.1f} {:9.1f} {:9.1f}\n'.format(
+                stage, h.count,
+                1e6 * h.sum / h.count if h.count else 0.0,
+                1e6 * h.percentile(50),
+                1e6 * h.percentile(99),
+                1e6 * h.max))
+        out.write('\n{:8s} '.format('<= us') +
+                  ' '.join('{:>6.0f}'.format(1e6 * b) for b in bounds) +
+                  ' {:>6s}\n'.format('more'))
+        for stage in STAGES:
+            out.write('{:8s} '.format(stage) +
+                      ' '.join('{:6d}'.format(n) for n in self._hist[stage].counts) +
+                      '\n')
+        out.flush()
+
+    def dumpOnSignal(self, path, signum=signal.SIGUSR1):
+        """
+        Append a dump to a file each time a signal is received
+
+        @param str path         file to append to
+        @param int signum       signal number
+        """
+        def _dump(*_):
+            with open(path, 'a') as out:
+                self.dump(out)
+                out.write('\n')
+        signal.signal(signum, _dump)
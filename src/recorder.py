@@ -0,0 +1,159 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Raw usb report session files
+
+Session file format, version 1, all values little-endian:
+
+Header (24 bytes):
+    4s  magic           b'SCRS'
+    u16 version         1
+    u16 header size     24, records start at this offset
+    u16 product id      usb product id of the device
+    u8  endpoint        interrupt endpoint number
+    u8  interface       usb interface number
+    u32 reserved        0
+    f64 start time      wall clock time (seconds since epoch) of the first
+                        timestamp
+
+Records (72 bytes each), until the end of file:
+    u64 timestamp       nanoseconds since the start of the session
+                        (monotonic clock)
+    64s report          raw usb report, as received
+
+Readers must check the version and skip header size bytes, so fields can be
+appended to the header without breaking them.
+"""
+
+import struct
+import time
+
+from steamcontroller.tools import monotonic
+
+SESSION_MAGIC = b'SCRS'
+SESSION_VERSION = 1
+
+_HEADER = struct.Struct('<4sHHHBBId')
+_STAMP = struct.Struct('<Q')
+
+REPORT_SIZE = 64
+RECORD_SIZE = _STAMP.size + REPORT_SIZE
+
+class SessionWriter(object):
+    """Append raw reports and their timestamp to a session file"""
+
+    def __init__(self, path, pid, endpoint, interface, buffering=64 * RECORD_SIZE):
+        """
+        Constructor
+
+        @param str path         session file to create
+        @param int pid          usb product id
+        @param int endpoint     interrupt endpoint number
+        @param int interface    usb interface number
+        @param int buffering    write buffer size in bytes
+        """
+        self._file = open(path, 'wb', buffering)
+        self._t0 = monotonic()
+        self._file.write(_HEADER.pack(SESSION_MAGIC,
+                                      SESSION_VERSION,
+                                      _HEADER.size,
+                                      pid,
+                                      endpoint,
+                                      interface,
+                                      0,
+                                      time.time()))
+        self.count = 0
+
+    def write(self, report, timestamp=None):
+        """
+        Append a report
+
+        @param buffer report    64 bytes raw report
+        @param float timestamp  monotonic time of reception, now by default
+        """
+        if timestamp is None:
+            timestamp = monotonic()
+        self._file.write(_STAMP.pack(max(0, int((timestamp - self._t0) * 1e9))))
+        self._file.write(report)
+        self.count += 1
+
+    def __call__(self, report, timestamp):
+        self.write(report, timestamp)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __del__(self):
+        self.close()
+
+class SessionReader(object):
+    """
+    Read a session file, iterating gives (timestamp, report) tuples with the
+    timestamp in seconds since the start of the session
+    """
+
+    def __init__(self, path):
+        """
+        Constructor
+
+        @param str path         session file to read
+        """
+        self._file = open(path, 'rb')
+        data = self._file.read(_HEADER.size)
+        if len(data) != _HEADER.size:
+            raise ValueError('{}: truncated session header'.format(path))
+        (magic,
+         self.version,
+         size,
+         self.pid,
+         self.endpoint,
+         self.interface,
+         _,
+         self.start) = _HEADER.unpack(data)
+        if magic != SESSION_MAGIC:
+            raise ValueError('{}: not a session file'.format(path))
+        if self.version > SESSION_VERSION:
+            raise ValueError('{}: unsupported session version {:d}'.format(path, self.version))
+        self._file.seek(size)
+
+    def __iter__(self):
+        unpack = _STAMP.unpack_from
+        read = self._file.read
+        while True:
+            data = read(RECORD_SIZE)
+            if len(data) < RECORD_SIZE:
+                return
+            yield unpack(data)[0] * 1e-9, data[_STAMP.size:]
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,87 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""Deadline scheduler run from the usb event loop"""
+
+import heapq
+import itertools
+
+from steamcontroller.tools import monotonic
+
+class Scheduler(object):
+    """
+    Deadline ordered timers.
+
+    Timers are not run by a thread: the owner of the event loop waits at
+    most timeout() seconds for usb events and then calls runPending(), so
+    timed ticks and usb completions are all handled on the same thread.
+    """
+
+    def __init__(self):
+        self._queue = []
+        self._counter = itertools.count()
+
+    def schedule(self, delay, func, *args):
+        """
+        Schedule a function call
+
+        @param float delay      delay in seconds from now
+        @param function func    function to call
+        @param args             arguments given to func
+
+        @return                 handle that can be given to cancel()
+        """
+        entry = [monotonic() + delay, next(self._counter), func, args]
+        heapq.heappush(self._queue, entry)
+        return entry
+
+    def cancel(self, entry):
+        """
+        Cancel a scheduled call (no effect if already run)
+
+        @param entry            handle returned by schedule()
+        """
+        entry[2] = None
+
+    def timeout(self, default=None):
+        """
+        Get the time to wait for the next deadline
+
+        @param float default    value returned when nothing is scheduled
+
+        @return float           seconds until the next deadline
+        """
+        queue = self._queue
+        while queue and queue[0][2] is None:
+            heapq.heappop(queue)
+        if not queue:
+            return default
+        return max(0.0, queue[0][0] - monotonic())
+
+    def runPending(self):
+        """Run all calls whose deadline is reached, in deadline order"""
+        queue = self._queue
+        now = monotonic()
+        while queue and queue[0][0] <= now:
+            _, _, func, args = heapq.heappop(queue)
+            if func is not None:
+                func(*args)
@@ -0,0 +1,133 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Controller settings
+
+Settings are sent as control messages: lizard mode (the keyboard and mouse
+emulation done by the controller itself without driver) is switched by
+dedicated commands, the others are registers written by command 0x87 as
+(register, 16 bits value) triplets.
+"""
+
+from collections import namedtuple, OrderedDict
+import struct
+
+from enum import IntEnum
+
+LIZARD_OFF = 0x81
+LIZARD_ON = (0x85, 0x8e)
+SET_REGISTERS = 0x87
+
+class ImuModes(IntEnum):
+    """Values of the IMU register"""
+    OFF = 0x0000
+    GYRO_QUATERNION = 0x0014
+
+class TrackpadModes(IntEnum):
+    """Values of the pad registers"""
+    # Pads only report their position, no built in mouse or haptic feedback
+    NONE = 0x0007
+
+class Registers(IntEnum):
+    RPAD_MODE = 0x07
+    LPAD_MODE = 0x08
+    IMU_MODE = 0x30
+    IDLE_TIMEOUT = 0x32
+
+# Registers always written with the same value, roles still unknown
+_FIXED_REGISTERS = {
+    0x18 : 0x0000,
+    0x31 : 0x0002,
+    0x2f : 0x0001,
+}
+
+# Write order of the registers
+_ORDER = [
+    Registers.IDLE_TIMEOUT,
+    0x18,
+    0x31,
+    Registers.LPAD_MODE,
+    Registers.RPAD_MODE,
+    Registers.IMU_MODE,
+    0x2f,
+]
+
+# IMU fields of SteamControllerInput, only reported when the IMU is on
+IMU_FIELDS = frozenset(['gpitch', 'groll', 'gyaw', 'q1', 'q2', 'q3', 'q4'])
+
+# lizard:       controller keyboard and mouse emulation
+# imu:          ImuModes
+# idle_timeout: seconds without input before a wireless controller turns off
+# lpad_mode:    TrackpadModes of the left pad
+# rpad_mode:    TrackpadModes of the right pad
+Settings = namedtuple('Settings', 'lizard imu idle_timeout lpad_mode rpad_mode')
+
+DEFAULT_SETTINGS = Settings(lizard=False,
+                            imu=ImuModes.OFF,
+                            idle_timeout=900,
+                            lpad_mode=TrackpadModes.NONE,
+                            rpad_mode=TrackpadModes.NONE)
+
+def settingsRegisters(settings):
+    """
+    Get register values of settings
+
+    @param Settings settings
+
+    @return OrderedDict     value by register, in write order
+    """
+    values = dict(_FIXED_REGISTERS)
+    values[Registers.IDLE_TIMEOUT] = settings.idle_timeout
+    values[Registers.LPAD_MODE] = settings.lpad_mode
+    values[Registers.RPAD_MODE] = settings.rpad_mode
+    values[Registers.IMU_MODE] = settings.imu
+    return OrderedDict((reg, values[reg]) for reg in _ORDER)
+
+def settingsMessages(settings, applied=None):
+    """
+    Build control messages applying settings
+
+    @param Settings settings    settings to apply
+    @param Settings applied     settings already applied, only differences
+                                are sent, None to send everything
+
+    @return list                control messages (bytes)
+    """
+    messages = []
+
+    if applied is None or settings.lizard != applied.lizard:
+        if settings.lizard:
+            messages.extend(struct.pack('>B', x) for x in LIZARD_ON)
+        else:
+            messages.append(struct.pack('>B', LIZARD_OFF))
+
+    registers = settingsRegisters(settings)
+    if applied is not None:
+        previous = settingsRegisters(applied)
+        registers = OrderedDict((reg, val) for reg, val in registers.items()
+                                if previous[reg] != val)
+    if len(registers) > 0:
+        data = b''.join(struct.pack('<BH', reg, val) for reg, val in registers.items())
+        messages.append(struct.pack('>BB', SET_REGISTERS, len(data)) + data)
+
+    return messages
@@ -0,0 +1,388 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+One worker process per controller interface under a supervisor (python 3.8+)
+
+Each worker claims one controller interface and runs its own
+SteamController and callback, so mapping runs on several cores and a crash
+only takes one controller down. Workers publish their last report and
+counters in a shared memory StateTable, the supervisor restarts the ones
+that exit.
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+import signal
+import struct
+import sys
+import time
+
+import usb1
+
+from steamcontroller import \
+    SteamController, \
+    SCInterface, \
+    ReportDecoder, \
+    VENDOR_ID, \
+    PRODUCT_ID, \
+    ENDPOINT, \
+    CONTROLIDX, \
+    TRANSFERS
+from steamcontroller.transport import USBTransport
+from steamcontroller.tools import monotonic
+
+MAX_SLOTS = 16
+
+# Seconds between two counters updates of a worker
+PUBLISH_PERIOD = 0.5
+
+# Seconds between two device scans of the supervisor
+SCAN_PERIOD = 2.0
+
+# Restart delays of a failing worker, doubled on each consecutive failure
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+
+# A worker running longer than this is not failing anymore
+STABLE_DURATION = 10.0
+
+# Reads of a slot being written before StateTable.read gives up
+READ_RETRIES = 1000
+
+# Worker exit codes the supervisor does not retry on
+EXIT_NO_DEVICE = 2
+EXIT_BUSY = 3
+
+# Slot: version, update time, worker pid, restarts, reports, dropped,
+# seq_lost, seq_duplicates, last report. The version is odd while the
+# slot is written.
+_VERSION = struct.Struct('<Q')
+_SLOT = struct.Struct('<dIIQQQQ64s')
+_REPORT_OFFSET = _VERSION.size + _SLOT.size - 64
+SLOT_SIZE = _VERSION.size + _SLOT.size
+
+class StateTable(object):
+    """
+    Shared memory table of controller states, one slot per worker.
+
+    A slot has only one writer at a time: the supervisor while its worker
+    is stopped, the worker otherwise. Readers retry while a slot is being
+    written. A worker killed during a write leaves its slot marked as
+    being written until the supervisor resets it.
+    """
+
+    def __init__(self, name=None, slots=MAX_SLOTS, create=False):
+        """
+        Constructor
+
+        @param str name         shared memory name, generated when created
+                                without name
+        @param int slots        number of slots
+        @param bool create      create the table instead of attaching to it
+        """
+        self._shm = shared_memory.SharedMemory(name=name,
+                                               create=create,
+                                               size=slots * SLOT_SIZE)
+        self._buf = self._shm.buf
+        self._decode = ReportDecoder().decode
+        self.name = self._shm.name
+        self.slots = slots
+        if create:
+            self._buf[:slots * SLOT_SIZE] = bytes(slots * SLOT_SIZE)
+
+    def _begin(self, slot, recover=False):
+        offset = slot * SLOT_SIZE
+        version = _VERSION.unpack_from(self._buf, offset)[0]
+        if recover:
+            # Left odd by a writer killed in the middle of a write
+            version &= ~1
+        _VERSION.pack_into(self._buf, offset, version + 1)
+        return offset, version + 2
+
+    def _end(self, offset, version):
+        _VERSION.pack_into(self._buf, offset, version)
+
+    def reset(self, slot, restarts=0):
+        """Clear a slot before its worker starts"""
+        offset, version = self._begin(slot, recover=True)
+        _SLOT.pack_into(self._buf, offset + _VERSION.size,
+                        0.0, 0, restarts, 0, 0, 0, 0, bytes(64))
+        self._end(offset, version)
+
+    def publishReport(self, slot, report):
+        offset, version = self._begin(slot)
+        start = offset + _REPORT_OFFSET
+        self._buf[start:start + 64] = report
+        self._end(offset, version)
+
+    def publishCounters(self, slot, pid, restarts, stats):
+        offset, version = self._begin(slot)
+        report = bytes(self._buf[offset + _REPORT_OFFSET:offset + _REPORT_OFFSET + 64])
+        _SLOT.pack_into(self._buf, offset + _VERSION.size,
+                        monotonic(), pid, restarts,
+                        stats['reports'], stats['dropped'],
+                        stats['seq_lost'], stats['seq_duplicates'],
+                        report)
+        self._end(offset, version)
+
+    def read(self, slot):
+        """
+        Read a slot
+
+        @return dict            time (monotonic time of the last counters
+                                update, 0 before the first one), pid,
+                                restarts, reports, dropped, seq_lost,
+                                seq_duplicates and input
+                                (SteamControllerInput), None when the slot
+                                stays being written
+        """
+        offset = slot * SLOT_SIZE
+        for _ in range(READ_RETRIES):
+            version = _VERSION.unpack_from(self._buf, offset)[0]
+            if not version & 1:
+                values = _SLOT.unpack_from(self._buf, offset + _VERSION.size)
+                if _VERSION.unpack_from(self._buf, offset)[0] == version:
+                    break
+            # Let the writer finish
+            time.sleep(0)
+        else:
+            return None
+        state = dict(zip(('time', 'pid', 'restarts', 'reports', 'dropped',
+                          'seq_lost', 'seq_duplicates'), values[:-1]))
+        state['input'] = self._decode(values[-1])
+        return state
+
+    def close(self, unlink=False):
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+def _worker(callback_factory, table_name, slot, restarts, key, transfers):
+    """Worker process main, claims one controller interface and runs it"""
+    bus, address, index = key
+    table = StateTable(table_name)
+    ctx = usb1.USBContext()
+
+    handle = None
+    for dev in ctx.getDeviceIterator(skip_on_error=True):
+        if dev.getBusNumber() == bus and dev.getDeviceAddress() == address:
+            handle = dev.open()
+            break
+    if handle is None:
+        sys.exit(EXIT_NO_DEVICE)
+
+    number = CONTROLIDX[index]
+    try:
+        if handle.kernelDriverActive(number):
+            handle.detachKernelDriver(number)
+        handle.claimInterface(number)
+    except usb1.USBErrorBusy:
+        sys.exit(EXIT_BUSY)
+
+    transport = USBTransport(ctx,
+                             SCInterface(handle,
+                                         PRODUCT_ID[index],
+                                         ENDPOINT[index],
+                                         CONTROLIDX[index],
+                                         number),
+                             transfers)
+    sc = SteamController(callback_factory(), transport=transport)
+
+    pid = multiprocessing.current_process().pid
+    last = [0.0]
+    def publish(report, timestamp):
+        table.publishReport(slot, report)
+        if timestamp - last[0] >= PUBLISH_PERIOD:
+            last[0] = timestamp
+            table.publishCounters(slot, pid, restarts, sc.getStats())
+    sc.addRawListener(publish)
+
+    # The supervisor stops workers with SIGTERM, the interface must still
+    # be released
+    def onTerm(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, onTerm)
+
+    try:
+        sc.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        table.publishCounters(slot, pid, restarts, sc.getStats())
+        sc._close()
+
+
+class _Worker(object):
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.process = None
+        self.restarts = 0
+        self.failures = 0
+        self.started = 0.0
+        self.start_at = 0.0
+
+
+class Supervisor(object):
+    """
+    Start one worker process per controller interface found, and restart
+    workers that exit until their device is unplugged. A worker finding its
+    interface claimed by another program is not restarted.
+    """
+
+    def __init__(self, callback_factory, transfers=TRANSFERS,
+                 slots=MAX_SLOTS, name=None):
+        """
+        Constructor
+
+        callback_factory: function without argument called in each worker,
+        returns its callback (see SteamController). Workers are spawned, it
+        must be importable: a module level function.
+
+        transfers: Number of interrupt transfers kept in flight per
+        controller
+
+        slots: Maximum number of workers
+
+        name: Optional name of the StateTable shared memory
+        """
+        self._factory = callback_factory
+        self._transfers = transfers
+        # libusb does not survive fork
+        self._mp = multiprocessing.get_context('spawn')
+        self._table = StateTable(name, slots, create=True)
+        self._workers = {}
+        self._free = list(range(slots))
+
+    @property
+    def table(self):
+        """StateTable of the workers"""
+        return self._table
+
+    def workers(self):
+        """
+        @return dict            StateTable slot by (bus, address, index)
+                                key, index in PRODUCT_ID
+        """
+        return {key : w.slot for key, w in self._workers.items()}
+
+    def _scan(self):
+        """Follow plugged and unplugged controller interfaces"""
+        present = set()
+        with usb1.USBContext() as ctx:
+            for dev in ctx.getDeviceIterator(skip_on_error=True):
+                if dev.getVendorID() != VENDOR_ID:
+                    continue
+                for i, pid in enumerate(PRODUCT_ID):
+                    if pid == dev.getProductID():
+                        present.add((dev.getBusNumber(), dev.getDeviceAddress(), i))
+
+        for key in [k for k in self._workers if k not in present]:
+            self._stop(self._workers.pop(key))
+
+        for key in sorted(present):
+            if key not in self._workers and len(self._free) > 0:
+                self._workers[key] = _Worker(self._free.pop(0))
+
+    def _start(self, key, worker):
+        self._table.reset(worker.slot, worker.restarts)
+        worker.process = self._mp.Process(target=_worker,
+                                          name='sc-worker-{:d}'.format(worker.slot),
+                                          args=(self._factory,
+                                                self._table.name,
+                                                worker.slot,
+                                                worker.restarts,
+                                                key,
+                                                self._transfers))
+        worker.process.daemon = True
+        worker.process.start()
+        worker.started = monotonic()
+
+    def _stop(self, worker):
+        if worker.process is not None:
+            worker.process.terminate()
+            worker.process.join()
+            worker.process = None
+        self._free.append(worker.slot)
+
+    def _reap(self, now):
+        """Schedule the restart of exited workers"""
+        for key, worker in self._workers.items():
+            if worker.process is None or worker.process.is_alive():
+                continue
+            code = worker.process.exitcode
+            worker.process = None
+            if code == EXIT_BUSY:
+                # Claimed by another program, retrying would not help
+                worker.start_at = float('inf')
+                sys.stderr.write('worker {:03d}:{:03d}:{:d} interface busy, not restarted\n'.format(
+                    key[0], key[1], key[2]))
+                continue
+            worker.restarts += 1
+            if code != 0 and now - worker.started < STABLE_DURATION:
+                worker.failures += 1
+            else:
+                worker.failures = 0
+            delay = min(RESTART_DELAY * 2 ** worker.failures, MAX_RESTART_DELAY)
+            worker.start_at = now + delay
+            sys.stderr.write('worker {:03d}:{:03d}:{:d} exited ({}), restart in {:.1f}s\n'.format(
+                key[0], key[1], key[2], code, delay))
+
+    def _onTerm(self, signum, frame):
+        raise SystemExit(0)
+
+    def run(self):
+        """Supervise workers, only returns when interrupted or terminated"""
+        # Daemon.stop() terminates, workers are stopped on the way out
+        signal.signal(signal.SIGTERM, self._onTerm)
+        next_scan = 0.0
+        try:
+            while True:
+                now = monotonic()
+                if now >= next_scan:
+                    self._scan()
+                    next_scan = now + SCAN_PERIOD
+                self._reap(now)
+                for key, worker in self._workers.items():
+                    if worker.process is None and now >= worker.start_at:
+                        self._start(key, worker)
+
+                # Wake up on worker exit, scan or restart deadline
+                deadlines = [next_scan] + [w.start_at for w in self._workers.values()
+                                           if w.process is None]
+                sentinels = [w.process.sentinel for w in self._workers.values()
+                             if w.process is not None]
+                wait(sentinels, max(0.0, min(deadlines) - monotonic()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._close()
+
+    def _close(self):
+        for worker in self._workers.values():
+            self._stop(worker)
+        self._workers.clear()
+        self._table.close(unlink=True)
@@ -0,0 +1,245 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Two threads pipeline: a reader thread owns the usb transport, decodes
+reports and sends control messages, the mapping thread runs the callback
+and timers. A slow callback then neither delays transfer resubmission nor
+haptic feedback.
+
+    sc = SteamController(callback=evm.process)
+    runThreaded(sc)
+"""
+
+from collections import deque
+import threading
+
+from enum import IntEnum
+
+from steamcontroller import EXITCMD, HPERIOD
+from steamcontroller.tools import monotonic
+
+RING_SIZE = 64
+
+class Overflow(IntEnum):
+    """What to do with a report when the ring is full"""
+    DROP_OLDEST = 0
+    DROP_NEWEST = 1
+
+class ReportRing(object):
+    """
+    Bounded single producer, single consumer queue.
+
+    Only the deque append and popleft, atomic in CPython, are shared
+    between threads: the producer never blocks on the consumer. Only the
+    producer appends and only the consumer pops, when the ring is full
+    with DROP_OLDEST the producer counts the items to drop and the
+    consumer drops them on its next pop.
+    """
+
+    def __init__(self, size=RING_SIZE, overflow=Overflow.DROP_OLDEST):
+        self._size = size
+        self._overflow = overflow
+        self._items = deque()
+        self._event = threading.Event()
+        self._closed = False
+        # Oldest items to drop, counted by the producer, and dropped by the
+        # consumer
+        self._skip = 0
+        self._skipped = 0
+        self._stats = {
+            'pushed' : 0,
+            'dropped' : 0,
+            'max_depth' : 0,
+        }
+
+    def push(self, item):
+        """Producer side, add an item following the overflow policy"""
+        items = self._items
+        depth = len(items) - (self._skip - self._skipped)
+        if depth >= self._size:
+            self._stats['dropped'] += 1
+            if self._overflow == Overflow.DROP_NEWEST:
+                return
+            self._skip += 1
+        else:
+            depth += 1
+        items.append(item)
+        self._stats['pushed'] += 1
+        if depth > self._stats['max_depth']:
+            self._stats['max_depth'] = depth
+        self._event.set()
+
+    def close(self):
+        """Producer side, no more items will be pushed"""
+        self._closed = True
+        self._event.set()
+
+    def isClosed(self):
+        return self._closed
+
+    def pop(self):
+        """Consumer side, get the oldest item or None when empty"""
+        items = self._items
+        try:
+            while self._skipped < self._skip:
+                items.popleft()
+                self._skipped += 1
+            return items.popleft()
+        except IndexError:
+            return None
+
+    def wait(self, timeout=None):
+        """Consumer side, wait until an item is available or timeout"""
+        self._event.clear()
+        if len(self._items) == 0 and not self._closed:
+            self._event.wait(timeout)
+
+    def getStats(self):
+        """
+        pushed:     items pushed
+        dropped:    items dropped by the overflow policy
+        depth:      items waiting
+        max_depth:  highest depth reached
+        """
+        stats = dict(self._stats)
+        stats['depth'] = max(0, len(self._items) - (self._skip - self._skipped))
+        return stats
+
+
+class _Reader(threading.Thread):
+    """Reader thread, owns the transport of a SteamController"""
+
+    def __init__(self, sc, ring, outbox):
+        threading.Thread.__init__(self, name='sc-reader')
+        self.daemon = True
+        self.error = None
+        self._sc = sc
+        self._ring = ring
+        self._outbox = outbox
+        self._stopping = False
+
+    def receive(self, buf):
+        sc = self._sc
+        now = monotonic()
+        tup = sc._decode(buf)
+        if sc._prof is not None:
+            sc._prof.add('decode', monotonic() - now)
+        # The transfer buffer is reused, copy it for raw listeners
+        raw = bytes(buf) if sc._raw_listeners else None
+        return (tup, raw, now)
+
+    def stop(self):
+        self._stopping = True
+        self._sc._transport.wakeup()
+
+    def run(self):
+        transport = self._sc._transport
+        outbox = self._outbox
+        try:
+            while not self._stopping and transport.isRunning():
+                transport.handleEvents(HPERIOD)
+                while len(outbox) > 0:
+                    cmsg = outbox.popleft()
+                    transport.sendControl(cmsg)
+                    if cmsg == EXITCMD:
+                        self._stopping = True
+        except Exception as err:
+            self.error = err
+        finally:
+            self._ring.close()
+
+
+def runThreaded(sc, size=RING_SIZE, overflow=Overflow.DROP_OLDEST):
+    """
+    Run a SteamController with a reader thread, the callback, raw listeners
+    and timers run in the calling thread. Returns like SteamController.run()
+    when the controller exits or stops sending reports.
+
+    @param SteamController sc   controller to run, created in this thread
+    @param int size             ring capacity in reports
+    @param Overflow overflow    policy when the mapping thread is late
+    """
+    ring = ReportRing(size, overflow)
+    outbox = deque()
+    reader = _Reader(sc, ring, outbox)
+    transport = sc._transport
+    sched = sc._sched
+    prof = sc._prof
+
+    def sendPending():
+        """Give the queued control messages to the reader thread"""
+        cmsg = sc._cmsg.pop()
+        if cmsg is None:
+            return True
+        while cmsg is not None:
+            outbox.append(cmsg)
+            if cmsg == EXITCMD:
+                break
+            cmsg = sc._cmsg.pop()
+        transport.wakeup()
+        return cmsg != EXITCMD
+
+    sc._ring = ring
+    transport.start(reader.receive, ring.push)
+    reader.start()
+    try:
+        while True:
+            item = ring.pop()
+            if item is None:
+                if ring.isClosed():
+                    break
+                ring.wait(sched.timeout())
+                sched.runPending()
+                # Timers queue messages too, like the exit on a long press
+                if not sendPending():
+                    break
+                continue
+
+            tup, raw, stamp = item
+            if raw is not None:
+                for listener in sc._raw_listeners:
+                    listener(raw, stamp)
+            if prof is not None:
+                prof.begin(stamp)
+            sc._handleInput(tup)
+            sched.runPending()
+
+            # Control messages go to the reader thread
+            if not sendPending():
+                break
+    finally:
+        reader.stop()
+        reader.join()
+        # The device may be gone, do not submit anything here
+        transport.setHandlers(sc._receive, sc._deliver)
+
+    if reader.error is not None:
+        raise reader.error
+
+    # Messages the reader did not send, or queued by a timer at the end
+    while len(outbox) > 0:
+        cmsg = outbox.popleft()
+        transport.sendControl(cmsg)
+        if cmsg == EXITCMD:
+            return
+    sc._sendPending()
@@ -24,7 +24,19 @@
 
 """Misc Tools"""
 
-import imp
+try:
+    from importlib.machinery import EXTENSION_SUFFIXES
+except ImportError:
+    # python2 fallback
+    import imp
+    EXTENSION_SUFFIXES = [ext for ext, _, typ in imp.get_suffixes()
+                          if typ == imp.C_EXTENSION]
+
+try:
+    from time import monotonic
+except ImportError:
+    # python2 fallback, not protected against wall clock changes
+    from time import time as monotonic
 
 def static_vars(**kwargs):
     """Static variable func decorator"""
@@ -38,6 +50,5 @@ def static_vars(**kwargs):
 
 def get_so_extensions():
     """Return so file extenstion compatible with python and pypy"""
-    for ext, _, typ in imp.get_suffixes():
-        if typ == imp.C_EXTENSION:
-            yield ext
+    for ext in EXTENSION_SUFFIXES:
+        yield ext
@@ -0,0 +1,482 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2015 Stany MARCEL <stanypub@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""Transports carrying reports and control messages to a SteamController"""
+
+import threading
+
+import usb1
+
+from steamcontroller import \
+    VENDOR_ID, \
+    PRODUCT_ID, \
+    ENDPOINT, \
+    CONTROLIDX, \
+    TRANSFERS, \
+    HPERIOD
+from steamcontroller.tools import monotonic
+from steamcontroller.recorder import SessionReader, REPORT_SIZE
+
+def handleEvents(ctx, timeout=None):
+    """
+    Wait for usb events of ctx, at most timeout seconds (None for no limit).
+    A signal handler returning normally (like a profiler dump) ends the wait
+    as a timeout would, KeyboardInterrupt still stops the caller.
+    """
+    try:
+        if timeout is None:
+            ctx.handleEvents()
+        else:
+            ctx.handleEventsTimeout(tv=timeout)
+    except usb1.USBErrorInterrupted:
+        pass
+
+class Transport(object):
+    """
+    Connection between a SteamController and a device.
+
+    start() gives the transport two functions: receive(report) is called
+    with each raw 64 bytes report while its buffer is valid, and returns the
+    item to deliver; deliver(item) is then called with items in reception
+    order, once the transport is ready to receive the next report.
+
+    start() may be called again to change the functions, reception goes on
+    without interruption, and submits again what is not in flight.
+    setHandlers() only changes the functions, reception is not restarted.
+
+    pid, endpoint and interface describe the device and are written in
+    session files.
+    """
+
+    pid = 0
+    endpoint = 0
+    interface = 0
+
+    def start(self, receive, deliver):
+        raise NotImplementedError
+
+    def setHandlers(self, receive, deliver):
+        """Change the functions given to start(), nothing is submitted"""
+        self._receive = receive
+        self._deliver = deliver
+
+    def isOpen(self):
+        """Return True until the transport is closed or detached"""
+        raise NotImplementedError
+
+    def isRunning(self):
+        """Return True while reports are still being received"""
+        raise NotImplementedError
+
+    def handleEvents(self, timeout=None):
+        """
+        Receive pending reports
+
+        @param float timeout    maximum time to wait in seconds, None for
+                                no limit
+        """
+        raise NotImplementedError
+
+    def sendControl(self, data, timeout=0):
+        """
+        Send a control message
+
+        @param bytes data       message, padded to 64 bytes
+        @param int timeout      timeout in ms, 0 for none
+        """
+        raise NotImplementedError
+
+    def wakeup(self):
+        """End a handleEvents() call waiting in another thread"""
+        pass
+
+    def detach(self):
+        """Forget an unplugged device"""
+        pass
+
+    def close(self):
+        pass
+
+    def getStats(self):
+        """@return dict         copy of the reception counters"""
+        return {}
+
+
+class USBTransport(Transport):
+    """libusb transport, keeps several interrupt transfers in flight"""
+
+    def __init__(self, ctx=None, interface=None, transfers=TRANSFERS):
+        """
+        Constructor
+
+        ctx: Optional usb1.USBContext shared with other controllers
+
+        interface: Optional SCInterface already claimed on ctx, the usb
+        handle stays owned by the caller. When not given the first free
+        controller is searched and claimed.
+
+        transfers: Number of interrupt transfers kept in flight, so the
+        endpoint is never left without a queued transfer while the callback
+        runs
+        """
+        self._handle = None
+        self._own_handle = interface is None
+        self._transfer_list = []
+        self._stats = {
+            'reports' : 0,
+            'dropped' : 0,
+            'starved' : 0,
+            'lost' : 0,
+        }
+        self._receive = None
+        self._deliver = None
+        self._ctx = ctx if ctx is not None else usb1.USBContext()
+
+        if interface is None:
+            self._open()
+        else:
+            (self._handle,
+             self.pid,
+             self.endpoint,
+             self._ccidx,
+             self.interface) = interface
+
+        # Each submission gets a sequence number so completions are
+        # delivered in submission order
+        self._rx_seq = 0
+        self._rx_next = 0
+        self._rx_pending = {}
+        self._inflight = 0
+
+        for _ in range(max(1, transfers)):
+            transfer = self._handle.getTransfer()
+            transfer.setInterrupt(
+                usb1.ENDPOINT_IN | self.endpoint,
+                64,
+                callback=self._processReceivedData,
+            )
+            self._transfer_list.append(transfer)
+
+    def _open(self):
+        """Search and claim the first free controller"""
+
+        handle = []
+        pid = []
+        endpoint = []
+        ccidx = []
+        for i in range(len(PRODUCT_ID)):
+            _pid = PRODUCT_ID[i]
+            _endpoint = ENDPOINT[i]
+            _ccidx = CONTROLIDX[i]
+
+            _handle = self._ctx.openByVendorIDAndProductID(
+                VENDOR_ID, _pid,
+                skip_on_error=True,
+            )
+            if _handle != None:
+                handle.append(_handle)
+                pid.append(_pid)
+                endpoint.append(_endpoint)
+                ccidx.append(_ccidx)
+
+        if len(handle) == 0:
+            raise ValueError('No SteamControler Device found')
+
+        claimed = False
+        for i in range(len(handle)):
+
+            self._ccidx = ccidx[i]
+            self._handle = handle[i]
+            self.pid = pid[i]
+            self.endpoint = endpoint[i]
+            dev = handle[i].getDevice()
+            cfg = dev[0]
+
+            try:
+                for inter in cfg:
+                    for setting in inter:
+                        number = setting.getNumber()
+                        if self._handle.kernelDriverActive(number):
+                            self._handle.detachKernelDriver(number)
+                        if (setting.getClass() == 3 and
+                            setting.getSubClass() == 0 and
+                            setting.getProtocol() == 0 and
+                            number == i+1):
+                            self._handle.claimInterface(number)
+                            self.interface = number
+                            claimed = True
+            except usb1.USBErrorBusy:
+                claimed = False
+
+            if claimed:
+                break
+
+        if not claimed:
+            raise ValueError('All SteamControler are busy')
+
+    def start(self, receive, deliver):
+        self._receive = receive
+        self._deliver = deliver
+        for transfer in self._transfer_list:
+            if not transfer.isSubmitted():
+                self._submit(transfer)
+
+    def close(self):
+        if self._handle:
+            if self._own_handle:
+                self._handle.releaseInterface(self.interface)
+                self._handle.resetDevice()
+                self._handle.close()
+            else:
+                # Other interfaces of the device are still in use
+                self._cancelTransfers()
+                self._handle.releaseInterface(self.interface)
+            self._handle = None
+
+    def detach(self):
+        self._handle = None
+
+    def _cancelTransfers(self):
+        for transfer in self._transfer_list:
+            if transfer.isSubmitted():
+                try:
+                    transfer.cancel()
+                except usb1.USBErrorNotFound:
+                    pass
+        retry = 10
+        while retry and any(x.isSubmitted() for x in self._transfer_list):
+            self._ctx.handleEventsTimeout(tv=HPERIOD)
+            retry -= 1
+
+    def __del__(self):
+        self.close()
+
+    def isOpen(self):
+        return self._handle is not None
+
+    def isRunning(self):
+        return (self._handle is not None and
+                any(x.isSubmitted() for x in self._transfer_list))
+
+    def handleEvents(self, timeout=None):
+        handleEvents(self._ctx, timeout)
+
+    def wakeup(self):
+        self._ctx.interruptEventHandler()
+
+    def sendControl(self, data, timeout=0):
+
+        zeros = b'\x00' * (64 - len(data))
+
+        self._handle.controlWrite(request_type=0x21,
+                                  request=0x09,
+                                  value=0x0300,
+                                  index=self._ccidx,
+                                  data=data + zeros,
+                                  timeout=timeout)
+
+    def submitControl(self, data, callback, user_data=None, timeout=0):
+        """
+        Send a control message without waiting for it
+
+        @param bytes data       message, padded to 64 bytes
+        @param function callback    function(transfer) called on completion
+        @param user_data        value returned by transfer.getUserData()
+        @param int timeout      timeout in ms, 0 for none
+
+        @return usb1.USBTransfer    transfer to keep alive until completion
+        """
+        transfer = self._handle.getTransfer()
+        transfer.setControl(0x21, 0x09, 0x0300, self._ccidx,
+                            data + b'\x00' * (64 - len(data)),
+                            callback=callback,
+                            user_data=user_data,
+                            timeout=timeout)
+        transfer.submit()
+        return transfer
+
+    def getStats(self):
+        stats = dict(self._stats)
+        stats['inflight'] = self._inflight
+        return stats
+
+    def _submit(self, transfer):
+        transfer.setUserData(self._rx_seq)
+        transfer.submit()
+        # Only a submitted transfer takes its sequence number, completions
+        # are delivered in sequence order and must not wait for a hole
+        self._rx_seq += 1
+        self._inflight += 1
+
+    def _resubmit(self, transfer):
+        """Submit a completed transfer again, lost when the device refuses it"""
+        try:
+            self._submit(transfer)
+        except usb1.USBErrorNoDevice:
+            pass
+        except usb1.USBError:
+            self._stats['lost'] += 1
+
+    def _processReceivedData(self, transfer):
+        """Private USB async Rx function"""
+
+        seq = transfer.getUserData()
+        status = transfer.getStatus()
+        self._inflight -= 1
+
+        item = None
+        if status == usb1.TRANSFER_COMPLETED:
+            if transfer.getActualLength() == 64:
+                item = self._receive(transfer.getBuffer())
+            else:
+                self._stats['dropped'] += 1
+
+            # Give the buffer back to libusb before delivering
+            if self._inflight == 0:
+                self._stats['starved'] += 1
+            self._resubmit(transfer)
+        elif status not in (usb1.TRANSFER_CANCELLED, usb1.TRANSFER_NO_DEVICE):
+            # Transient error (stall, overflow, timeout...), the transfer
+            # stays in the ring
+            self._stats['dropped'] += 1
+            self._resubmit(transfer)
+
+        self._rx_pending[seq] = item
+        while self._rx_next in self._rx_pending:
+            item = self._rx_pending.pop(self._rx_next)
+            self._rx_next += 1
+            if item is None:
+                continue
+            self._stats['reports'] += 1
+            self._deliver(item)
+
+
+class FakeTransport(Transport):
+    """
+    In process transport without hardware, for tests and benchmarks.
+
+    Reports are taken from an iterable of 64 bytes reports, a generator or
+    a recorded session (see fromSession). Control messages are not sent
+    anywhere, they are appended to the controls list.
+    """
+
+    def __init__(self, reports, rate=None, pid=0x1142, endpoint=2, interface=1):
+        """
+        Constructor
+
+        reports: iterable of raw 64 bytes reports, the transport stops
+        running when it is exhausted
+
+        rate: reports per second, None to feed one report per handleEvents()
+        call, as fast as the consumer goes
+
+        pid, endpoint, interface: device description
+        """
+        self.pid = pid
+        self.endpoint = endpoint
+        self.interface = interface
+        self.controls = []
+        self._reports = iter(reports)
+        self._period = 1.0 / rate if rate else None
+        self._next = None
+        self._receive = None
+        self._deliver = None
+        self._open = True
+        self._running = False
+        self._woken = threading.Event()
+        self._stats = {
+            'reports' : 0,
+            'dropped' : 0,
+            'starved' : 0,
+            # Same counters as USBTransport, nothing is ever in flight
+            'lost' : 0,
+            'inflight' : 0,
+        }
+
+    @classmethod
+    def fromSession(cls, path, rate=None):
+        """
+        Replay a session recorded with SteamController.record()
+
+        @param str path         session file
+        @param float rate       reports per second, None for no pacing
+        """
+        reader = SessionReader(path)
+        return cls((report for _, report in reader), rate,
+                   pid=reader.pid,
+                   endpoint=reader.endpoint,
+                   interface=reader.interface)
+
+    def start(self, receive, deliver):
+        self._receive = receive
+        self._deliver = deliver
+        if self._next is None:
+            self._running = True
+            self._next = monotonic()
+
+    def isOpen(self):
+        return self._open
+
+    def isRunning(self):
+        return self._open and self._running
+
+    def handleEvents(self, timeout=None):
+        if not self.isRunning():
+            return
+
+        if self._period is not None:
+            delay = self._next - monotonic()
+            if delay > 0:
+                if timeout is not None and timeout < delay:
+                    delay = timeout
+                self._woken.wait(delay)
+                self._woken.clear()
+                if monotonic() < self._next:
+                    return
+            self._next += self._period
+
+        try:
+            report = next(self._reports)
+        except StopIteration:
+            self._running = False
+            return
+
+        if len(report) != REPORT_SIZE:
+            self._stats['dropped'] += 1
+            return
+        self._stats['reports'] += 1
+        self._deliver(self._receive(memoryview(report)))
+
+    def sendControl(self, data, timeout=0):
+        self.controls.append(data + b'\x00' * (64 - len(data)))
+
+    def wakeup(self):
+        self._woken.set()
+
+    def detach(self):
+        self._open = False
+
+    def close(self):
+        self._open = False
+
+    def getStats(self):
+        return dict(self._stats)
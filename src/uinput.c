@@ -138,7 +138,21 @@ int uinput_init(
 }
 
 
-void uinput_key(int fd, __u16 key, __s32 val)
+int uinput_event_size(void)
+{
+    return sizeof(struct input_event);
+}
+
+int uinput_sysname(int fd, char * name, int len)
+{
+#ifdef UI_GET_SYSNAME
+    return ioctl(fd, UI_GET_SYSNAME(len), name);
+#else
+    return -1;
+#endif
+}
+
+void uinput_key(int fd, int key, int val)
 {
     struct input_event ev;
 
@@ -149,7 +163,7 @@ void uinput_key(int fd, __u16 key, __s32 val)
     write(fd, &ev, sizeof(ev));
 }
 
-void uinput_abs(int fd, __u16 abs, __s32 val)
+void uinput_abs(int fd, int abs, int val)
 {
     struct input_event ev;
 
@@ -160,7 +174,7 @@ void uinput_abs(int fd, __u16 abs, __s32 val)
     write(fd, &ev, sizeof(ev));
 }
 
-void uinput_rel(int fd, __u16 rel, __s32 val)
+void uinput_rel(int fd, int rel, int val)
 {
     struct input_event ev;
 
@@ -171,7 +185,7 @@ void uinput_rel(int fd, __u16 rel, __s32 val)
     write(fd, &ev, sizeof(ev));
 }
 
-void uinput_scan(int fd, __s32 val)
+void uinput_scan(int fd, int val)
 {
     struct input_event ev;
 
@@ -25,21 +25,21 @@
 
 import os
 import ctypes
-import _ctypes
+import struct
 import time
 from math import pi, copysign, sqrt
 from enum import IntEnum
-from steamcontroller.cheader import defines
+from steamcontroller.cheader import cached_defines
 
-from steamcontroller.tools import get_so_extensions
+from steamcontroller.tools import get_so_extensions, static_vars, monotonic
 
 from collections import deque
 
 # Get All defines from linux headers
 if os.path.exists('/usr/include/linux/input-event-codes.h'):
-    CHEAD = defines('/usr/include', 'linux/input-event-codes.h')
+    CHEAD = cached_defines('/usr/include', 'linux/input-event-codes.h')
 else:
-    CHEAD = defines('/usr/include', 'linux/input.h')
+    CHEAD = cached_defines('/usr/include', 'linux/input.h')
 
 # Keys enum contains all keys and button from linux/uinput.h (KEY_* BTN_*)
 Keys = IntEnum('Keys', {i: CHEAD[i] for i in CHEAD.keys() if (i.startswith('KEY_') or
@@ -53,6 +53,24 @@ Axes = IntEnum('Axes', {i: CHEAD[i] for i in CHEAD.keys() if i.startswith('ABS_'
 # Rels enum contains all rels from linux/uinput.h (REL_*)
 Rels = IntEnum('Rels', {i: CHEAD[i] for i in CHEAD.keys() if i.startswith('REL_')})
 
+# struct input_event: struct timeval time, __u16 type, __u16 code, __s32 value
+INPUT_EVENT = struct.Struct('@llHHi')
+
+# Events buffered by device before a write, a frame ends with a syn event
+MAX_EVENTS = 64
+
+# Maximum wait for the evdev node of a new device, in seconds
+READY_TIMEOUT = 2.0
+READY_POLL = 0.005
+
+EV_SYN = CHEAD['EV_SYN']
+EV_KEY = CHEAD['EV_KEY']
+EV_REL = CHEAD['EV_REL']
+EV_ABS = CHEAD['EV_ABS']
+EV_MSC = CHEAD['EV_MSC']
+SYN_REPORT = CHEAD['SYN_REPORT']
+MSC_SCAN = CHEAD['MSC_SCAN']
+
 # Scan codes for each keys (taken from a logitech keyboard)
 Scans = {
     Keys.KEY_ESC: 0x70029,
@@ -175,6 +193,76 @@ Scans = {
 }
 
 
+_U16P = ctypes.POINTER(ctypes.c_uint16)
+_S32P = ctypes.POINTER(ctypes.c_int32)
+
+# libuinput functions: restype, argtypes. The event functions take int
+# parameters and are left without argtypes, python ints are then passed as
+# C int directly, argtypes conversions cost more than the call itself.
+PROTOTYPES = {
+    'uinput_init' : (ctypes.c_int, [ctypes.c_int, _U16P,
+                                    ctypes.c_int, _U16P, _S32P, _S32P, _S32P, _S32P,
+                                    ctypes.c_int, _U16P,
+                                    ctypes.c_int,
+                                    ctypes.c_uint16, ctypes.c_uint16, ctypes.c_uint16,
+                                    ctypes.c_char_p]),
+    'uinput_event_size' : (ctypes.c_int, []),
+    'uinput_sysname' : (ctypes.c_int, [ctypes.c_int, ctypes.c_char_p, ctypes.c_int]),
+    'uinput_key' : (None, None),
+    'uinput_abs' : (None, None),
+    'uinput_rel' : (None, None),
+    'uinput_scan' : (None, None),
+    'uinput_set_delay_period' : (None, [ctypes.c_int, ctypes.c_int32, ctypes.c_int32]),
+    'uinput_syn' : (None, None),
+    'uinput_destroy' : (None, [ctypes.c_int]),
+}
+
+@static_vars(lib=None)
+def loadLibrary():
+    """
+    Load libuinput once for the process, shared by all devices, with the
+    prototypes of its functions declared
+
+    @return ctypes.CDLL     libuinput
+    """
+    if loadLibrary.lib is not None:
+        return loadLibrary.lib
+
+    possible_paths = []
+    for extension in get_so_extensions():
+        possible_paths.append(
+            os.path.abspath(
+                os.path.normpath(
+                    os.path.join(
+                        os.path.dirname(__file__),
+                        '..',
+                        'libuinput' + extension
+                    )
+                )
+            )
+        )
+    lib = None
+    for path in possible_paths:
+        if os.path.exists(path):
+            lib = path
+            break
+    if not lib:
+        raise OSError('Cant find libuinput. searched at:\n {}'.format(
+            '\n'.join(possible_paths)
+        )
+    )
+
+    lib = ctypes.CDLL(lib)
+    for name, (restype, argtypes) in PROTOTYPES.items():
+        # Older builds may miss recent functions
+        func = getattr(lib, name, None)
+        if func is not None:
+            func.restype = restype
+            if argtypes is not None:
+                func.argtypes = argtypes
+    loadLibrary.lib = lib
+    return lib
+
 
 class UInput(object):
     """
@@ -199,33 +287,19 @@ class UInput(object):
         self.version = version
         self.keyboard = keyboard
         self._fd = None
+        self._buf = None
+        self._view = None
+        self._pos = 0
+        self._events = 0
+        self._frames = 0
+        self._writes = 0
+        self._create_time = 0.0
 
     def createDevice(self):
-        possible_paths = []
-        for extension in get_so_extensions():
-            possible_paths.append(
-                os.path.abspath(
-                    os.path.normpath(
-                        os.path.join(
-                            os.path.dirname(__file__),
-                            '..',
-                            'libuinput' + extension
-                        )
-                    )
-                )
-            )
-        lib = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                lib = path
-                break
-        if not lib:
-            raise OSError('Cant find libuinput. searched at:\n {}'.format(
-                '\n'.join(possible_paths)
-            )
-        )
-
-        self._lib = ctypes.CDLL(lib)
+        if self._fd is not None:
+            return
+        start = monotonic()
+        self._lib = loadLibrary()
 
         c_k        = (ctypes.c_uint16 * len(self._k))(*self._k)
         c_a        = (ctypes.c_uint16 * len(self._a))(*self._a)
@@ -234,27 +308,118 @@ class UInput(object):
         c_afuzz    = (ctypes.c_int32  * len(self._afuzz))(*self._afuzz)
         c_aflat    = (ctypes.c_int32  * len(self._aflat))(*self._aflat)
         c_r        = (ctypes.c_uint16 * len(self._r))(*self._r)
-        c_vendor   = ctypes.c_uint16(self.vendor)
-        c_product  = ctypes.c_uint16(self.product)
-        c_version  = ctypes.c_uint16(self.version)
-        c_keyboard = ctypes.c_int(self.keyboard)
 
-        c_name = ctypes.c_char_p(self.name)
-        self._fd = self._lib.uinput_init(ctypes.c_int(len(self._k)),
+        self._fd = self._lib.uinput_init(len(self._k),
                                          c_k,
-                                         ctypes.c_int(len(self._a)),
+                                         len(self._a),
                                          c_a,
                                          c_amin,
                                          c_amax,
                                          c_afuzz,
                                          c_aflat,
-                                         ctypes.c_int(len(self._r)),
+                                         len(self._r),
                                          c_r,
-                                         c_keyboard,
-                                         c_vendor,
-                                         c_product,
-                                         c_version,
-                                         c_name)
+                                         int(self.keyboard),
+                                         self.vendor,
+                                         self.product,
+                                         self.version,
+                                         self.name)
+        self._setupWrites()
+        self._create_time += monotonic() - start
+
+    def getSysName(self):
+        """
+        Get the name given by the kernel to the device (like input12)
+
+        @return str             None when unknown
+        """
+        if (self._fd is None or self._fd < 0 or
+                getattr(self._lib, 'uinput_sysname', None) is None):
+            return None
+        name = ctypes.create_string_buffer(64)
+        if self._lib.uinput_sysname(self._fd, name, len(name)) < 0:
+            return None
+        return name.value.decode('ascii')
+
+    def getDevNode(self):
+        """
+        Get the evdev node of the device
+
+        @return str             /dev/input/event* path, None until the device
+                                is registered
+        """
+        sysname = self.getSysName()
+        if sysname is None:
+            return None
+        try:
+            for entry in os.listdir(os.path.join('/sys/class/input', sysname)):
+                if entry.startswith('event'):
+                    node = os.path.join('/dev/input', entry)
+                    if os.path.exists(node):
+                        return node
+        except OSError:
+            pass
+        return None
+
+    def waitReady(self, timeout=READY_TIMEOUT):
+        """
+        Create the device if needed and wait until its evdev node appears,
+        events sent before may be lost by the readers
+
+        @param float timeout    maximum wait in seconds
+
+        @return bool            False when the node did not appear in time
+        """
+        self.createDevice()
+        # Nothing to wait for when the creation failed, or with kernels
+        # older than 3.15 which can not name the device
+        if self.getSysName() is None:
+            return False
+        start = monotonic()
+        deadline = start + timeout
+        ready = self.getDevNode() is not None
+        while not ready and monotonic() < deadline:
+            time.sleep(READY_POLL)
+            ready = self.getDevNode() is not None
+        self._create_time += monotonic() - start
+        return ready
+
+    def _setupWrites(self):
+        """
+        Buffer events until synEvent when python and libuinput agree on the
+        input_event layout, else each event is written by libuinput
+        """
+        try:
+            batched = self._lib.uinput_event_size() == INPUT_EVENT.size
+        except AttributeError:
+            # libuinput built without uinput_event_size
+            batched = False
+        if batched:
+            self._buf = bytearray(INPUT_EVENT.size * MAX_EVENTS)
+            self._view = memoryview(self._buf)
+        else:
+            self._buf = None
+            self._view = None
+        self._pos = 0
+
+    def _queue(self, typ, code, val):
+        """Add an event to the frame buffer"""
+        INPUT_EVENT.pack_into(self._buf, self._pos, 0, 0, typ, code, val)
+        self._pos += INPUT_EVENT.size
+        self._events += 1
+        if self._pos == len(self._buf):
+            self._flush()
+
+    def _flush(self):
+        """Write buffered events with a single syscall"""
+        if self._pos:
+            try:
+                os.write(self._fd, self._view[:self._pos])
+            except OSError:
+                # Lost, like write errors of libuinput
+                pass
+            self._writes += 1
+            self._pos = 0
 
 
     def keyEvent(self, key, val):
@@ -268,9 +433,12 @@ class UInput(object):
         if self._fd == None:
             self.createDevice()
 
-        self._lib.uinput_key(self._fd,
-                             ctypes.c_uint16(key),
-                             ctypes.c_int32(val))
+        if self._buf is not None:
+            self._queue(EV_KEY, key, val)
+        else:
+            self._lib.uinput_key(self._fd, key, val)
+            self._writes += 1
+            self._events += 1
 
 
     def axisEvent(self, axis, val):
@@ -284,9 +452,12 @@ class UInput(object):
         if self._fd == None:
             self.createDevice()
 
-        self._lib.uinput_abs(self._fd,
-                             ctypes.c_uint16(axis),
-                             ctypes.c_int32(val))
+        if self._buf is not None:
+            self._queue(EV_ABS, axis, val)
+        else:
+            self._lib.uinput_abs(self._fd, axis, val)
+            self._writes += 1
+            self._events += 1
 
     def relEvent(self, rel, val):
         """
@@ -299,9 +470,12 @@ class UInput(object):
         if self._fd == None:
             self.createDevice()
 
-        self._lib.uinput_rel(self._fd,
-                             ctypes.c_uint16(rel),
-                             ctypes.c_int32(val))
+        if self._buf is not None:
+            self._queue(EV_REL, rel, val)
+        else:
+            self._lib.uinput_rel(self._fd, rel, val)
+            self._writes += 1
+            self._events += 1
 
     def scanEvent(self, val):
         """
@@ -313,18 +487,29 @@ class UInput(object):
         if self._fd == None:
             self.createDevice()
 
-        self._lib.uinput_scan(self._fd,
-                              ctypes.c_int32(val))
+        if self._buf is not None:
+            self._queue(EV_MSC, MSC_SCAN, val)
+        else:
+            self._lib.uinput_scan(self._fd, val)
+            self._writes += 1
+            self._events += 1
 
     def synEvent(self):
         """
-        Generate a syn event
+        Generate a syn event, buffered events of the frame are written
         """
 
         if self._fd == None:
             self.createDevice()
 
-        self._lib.uinput_syn(self._fd)
+        if self._buf is not None:
+            self._queue(EV_SYN, SYN_REPORT, 0)
+            self._flush()
+        else:
+            self._lib.uinput_syn(self._fd)
+            self._writes += 1
+            self._events += 1
+        self._frames += 1
 
 
     def setDelayPeriod(self, delay, period):
@@ -338,9 +523,55 @@ class UInput(object):
         if self._fd == None:
             self.createDevice()
 
-        self._lib.uinput_set_delay_period(self._fd,
-                                          ctypes.c_int32(delay),
-                                          ctypes.c_int32(period))
+        self._flush()
+        self._lib.uinput_set_delay_period(self._fd, delay, period)
+        self._writes += 2
+        self._events += 2
+
+    def getStats(self):
+        """
+        Get output counters
+
+        events:       input events generated
+        frames:       syn events, one by report changing the device
+        writes:       write syscalls to the uinput device
+        create_time:  seconds spent creating the device and waiting for
+                      its evdev node
+
+        @return dict            counters by name
+        """
+        return {
+            'events' : self._events,
+            'frames' : self._frames,
+            'writes' : self._writes,
+            'create_time' : self._create_time,
+        }
+
+    def getDefinition(self):
+        """
+        Get what makes two devices interchangeable: class, ids, name and
+        capabilities
+
+        @return tuple           hashable definition
+        """
+        return (type(self), self.vendor, self.product, self.version, self.name,
+                tuple(sorted(self._k)),
+                tuple(sorted(zip(self._a, self._amin, self._amax, self._afuzz, self._aflat))),
+                tuple(sorted(self._r)),
+                bool(self.keyboard))
+
+    def reset(self):
+        """
+        Release all keys and center all axes, before the device is given to
+        another user. The kernel drops the events not changing a value.
+        """
+        if self._fd is None:
+            return
+        for key in self._k:
+            self.keyEvent(key, 0)
+        for axis in self._a:
+            self.axisEvent(axis, 0)
+        self.synEvent()
 
     def keyManaged(self, ev):
         return ev in self._k
@@ -357,10 +588,78 @@ class UInput(object):
         if self._lib and self._fd:
             self._lib.uinput_destroy(self._fd)
             self._fd = None
-            _ctypes.dlclose(self._lib._handle)
+            # The library stays loaded for the other devices
             self._lib = None
 
 
+class DevicePool(object):
+    """
+    Keep uinput devices open between their users, like the EventMappers of
+    successive profiles or daemon runs. Programs reading the devices do not
+    see them disappear, and the devices are not registered again.
+
+    Devices are matched by definition (see UInput.getDefinition), a free
+    device is rebuilt only when a device with the same class, ids and name
+    but other capabilities is asked.
+    """
+
+    def __init__(self):
+        self._free = {}
+        self._created = 0
+        self._reused = 0
+
+    def borrow(self, device):
+        """
+        Get a free device with the same definition
+
+        @param UInput device    device not created yet, giving the definition
+
+        @return UInput          a free device, or device when none matches
+        """
+        key = device.getDefinition()
+        free = self._free.get(key)
+        if free:
+            self._reused += 1
+            return free.pop()
+
+        # Same device with other capabilities, it is rebuilt
+        for other in list(self._free):
+            if other[:5] == key[:5]:
+                del self._free[other]
+
+        self._created += 1
+        return device
+
+    def release(self, device):
+        """
+        Give back a device, its keys are released and its axes centered
+
+        @param UInput device    device returned by borrow
+        """
+        device.reset()
+        self._free.setdefault(device.getDefinition(), []).append(device)
+
+    def clear(self):
+        """Destroy the free devices"""
+        self._free = {}
+
+    def getStats(self):
+        """
+        Get pool counters
+
+        created:  devices given by borrowers, no free device matched
+        reused:   free devices given again
+        free:     devices currently free
+
+        @return dict            counters by name
+        """
+        return {
+            'created' : self._created,
+            'reused' : self._reused,
+            'free' : sum(len(x) for x in self._free.values()),
+        }
+
+
 class Gamepad(UInput):
     """
     Gamepad uinput class, create a Xbox360 gamepad device
@@ -522,6 +821,39 @@ class Mouse(UInput):
         self._scr_xvel_dq = deque(maxlen=mean_len)
         self._scr_yvel_dq = deque(maxlen=mean_len)
 
+    def getMoveInertia(self):
+        """
+        Get the time left before the free move ball stops, friction
+        decelerates it at a constant rate
+
+        @return float           duration in seconds, 0 when stopped
+        """
+        return sqrt((self._xvel**2) + (self._yvel**2)) / self._acc
+
+    def getScrollInertia(self):
+        """
+        Get the time left before the free scroll ball stops
+
+        @return float           duration in seconds, 0 when stopped
+        """
+        return sqrt((self._scr_xvel**2) + (self._scr_yvel**2)) / self._scr_a
+
+    def reset(self):
+        """Release the buttons and stop the balls"""
+        super(Mouse, self).reset()
+        self._dx = 0.0
+        self._dy = 0.0
+        self._xvel = 0.0
+        self._yvel = 0.0
+        self._xvel_dq.clear()
+        self._yvel_dq.clear()
+        self._scr_dx = 0.0
+        self._scr_dy = 0.0
+        self._scr_xvel = 0.0
+        self._scr_yvel = 0.0
+        self._scr_xvel_dq.clear()
+        self._scr_yvel_dq.clear()
+
 
     def moveEvent(self, dx=0, dy=0, free=False):
         """
@@ -712,10 +1044,27 @@ class Keyboard(UInput):
                                        axes=[],
                                        rels=[],
                                        keyboard=True)
-        self.setDelayPeriod(250, 33)
+        self._delay_period = (250, 33)
         self._dx = 0.0
         self._pressed = set()
 
+    def createDevice(self):
+        if self._fd is not None:
+            return
+        super(Keyboard, self).createDevice()
+        self.setDelayPeriod(*self._delay_period)
+
+    def setDelayPeriod(self, delay, period):
+        # Applied at creation when the device is not created yet
+        self._delay_period = (delay, period)
+        if self._fd is not None:
+            super(Keyboard, self).setDelayPeriod(delay, period)
+
+    def reset(self):
+        """Release the pressed keys"""
+        if self._fd is not None:
+            self.releaseEvent()
+
     def pressEvent(self, keys):
         """
         Generate key press event with corresponding scan codes.
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+"""
+Gyro columns built from per report callbacks versus batched NumPy delivery,
+with synthetic reports from a FakeTransport.
+"""
+
+import os
+import time
+
+import numpy
+
+from steamcontroller import SteamController, SCStatus
+from steamcontroller.transport import FakeTransport
+from steamcontroller.batch import BatchCollector
+
+N = 100000
+NAMES = ('gpitch', 'groll', 'gyaw', 'q1', 'q2', 'q3', 'q4')
+
+def _report(i):
+    report = bytearray(os.urandom(64))
+    report[2] = SCStatus.INPUT
+    report[4:6] = (i & 0xffff).to_bytes(2, 'little')
+    return bytes(report)
+
+REPORTS = [_report(i) for i in range(N)]
+
+def reports():
+    return iter(REPORTS)
+
+def per_report():
+    cols = {name : [] for name in NAMES}
+    def cb(sc, sci):
+        d = sci._asdict()
+        for name in NAMES:
+            cols[name].append(d[name])
+    sc = SteamController(callback=cb, transport=FakeTransport(reports()))
+    sc.run()
+    return {name : numpy.array(col) for name, col in cols.items()}
+
+def batched():
+    cols = {name : [] for name in NAMES}
+    def cb(sc, batch, times):
+        batch = batch[batch['status'] == SCStatus.INPUT]
+        for name in NAMES:
+            cols[name].append(batch[name])
+    sc = SteamController(callback=None, transport=FakeTransport(reports()))
+    collector = BatchCollector(sc, cb, size=256)
+    sc.run()
+    collector.close()
+    return {name : numpy.concatenate(col) for name, col in cols.items()}
+
+if __name__ == '__main__':
+    for func in (per_report, batched):
+        start = time.process_time()
+        cols = func()
+        t = time.process_time() - start
+        print('{:10s} {:d} reports {:.2f}s cpu, {:.1f}us/report'.format(
+            func.__name__, len(cols['gpitch']), t, 1e6 * t / N))
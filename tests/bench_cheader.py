@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+"""
+Compare the regex define extractor with the token by token one on the
+kernel input headers, they must give the same defines in the same order,
+then time both.
+"""
+
+import sys
+import timeit
+
+from steamcontroller.cheader import defines, defines_shlex
+
+BASE = '/usr/include'
+HEADERS = ['linux/input-event-codes.h', 'linux/input.h', 'linux/uinput.h']
+N = 20
+
+ok = True
+for header in HEADERS:
+    old = defines_shlex(BASE, header)
+    new = defines(BASE, header)
+    same = list(old.items()) == list(new.items())
+    ok &= same
+    print('{:28s} {:4d} defines  {}'.format(header, len(new), 'same' if same else 'DIFFERENT'))
+    if not same:
+        for name in sorted(set(old) | set(new)):
+            if old.get(name) != new.get(name):
+                print('  {:32s} {!r:>12} {!r:>12}'.format(name, old.get(name), new.get(name)))
+
+print()
+for header in HEADERS:
+    t_old = min(timeit.repeat(lambda: defines_shlex(BASE, header), number=N, repeat=3)) / N
+    t_new = min(timeit.repeat(lambda: defines(BASE, header), number=N, repeat=3)) / N
+    print('{:28s} shlex {:7.2f} ms  regex {:7.2f} ms  x{:.1f}'.format(header, t_old * 1000, t_new * 1000, t_old / t_new))
+
+sys.exit(0 if ok else 1)
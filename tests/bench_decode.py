@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+"""Micro benchmark of the usb report decoder (reports/sec on one core)"""
+
+import os
+import struct
+import timeit
+
+from steamcontroller import \
+    SteamControllerInput, \
+    ReportDecoder, \
+    _FORMATS
+
+N = 200000
+
+# Same memory type as the libusb transfer buffer
+buf = memoryview(bytearray(os.urandom(64)))
+
+def legacy():
+    return SteamControllerInput._make(struct.unpack('<' + ''.join(_FORMATS), buf))
+
+decode = ReportDecoder().decode
+
+def current():
+    return decode(buf)
+
+assert legacy() == current()
+
+for name, func in [('legacy', legacy), ('decoder', current)]:
+    t = min(timeit.repeat(func, number=N, repeat=5))
+    print('{:10s} {:12.0f} reports/s'.format(name, N / t))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""
+Per report dispatch latency of the synchronous run() loop and of the asyncio
+front end: time from usb completion to the report reaching the consumer.
+
+Needs a controller, keep moving a stick or a pad while it runs.
+"""
+
+import asyncio
+from collections import deque
+
+from steamcontroller import SteamController
+from steamcontroller.aio import AsyncSteamController
+from steamcontroller.transport import USBTransport
+from steamcontroller.tools import monotonic
+
+N = 2000
+
+# Stamp each usb completion
+stamp = [0.0]
+_process = USBTransport._processReceivedData
+def _stamped(self, transfer):
+    stamp[0] = monotonic()
+    _process(self, transfer)
+USBTransport._processReceivedData = _stamped
+
+def summary(name, lat):
+    lat = sorted(lat)
+    print('{:6s} n={:d} mean={:.1f}us p50={:.1f}us p99={:.1f}us'.format(
+        name, len(lat),
+        1e6 * sum(lat) / len(lat),
+        1e6 * lat[len(lat) // 2],
+        1e6 * lat[int(len(lat) * 0.99)]))
+
+def bench_sync():
+    lat = []
+    def cb(sc, sci):
+        lat.append(monotonic() - stamp[0])
+        if len(lat) >= N:
+            sc.addExit()
+    sc = SteamController(callback=cb)
+    sc.run()
+    del sc
+    return lat
+
+async def bench_async():
+    lat = []
+    stamps = deque()
+    ctl = AsyncSteamController()
+
+    # Stamp each report handed to the asyncio queue
+    _on_input = ctl._onInput
+    def _stamped_input(sc, sci):
+        stamps.append(stamp[0])
+        _on_input(sc, sci)
+    ctl._sc._cb = _stamped_input
+
+    async for sci in ctl.reports():
+        lat.append(monotonic() - stamps.popleft())
+        if len(lat) >= N:
+            break
+    if ctl.dropped:
+        print('async: {:d} reports dropped, latencies are skewed'.format(ctl.dropped))
+    ctl.close()
+    return lat
+
+if __name__ == '__main__':
+    summary('sync', bench_sync())
+    summary('async', asyncio.run(bench_async()))
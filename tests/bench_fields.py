@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+"""
+Full report decoding versus decoding only the fields read by the mapper,
+for the xbox, desktop and VDF configurable profiles. Synthetic reports are
+fed by a FakeTransport; needs write access to /dev/uinput.
+"""
+
+import importlib.util
+import os
+import timeit
+import time
+
+from steamcontroller import \
+    SteamController, \
+    ReportDecoder, \
+    SCStatus
+from steamcontroller.transport import FakeTransport
+from steamcontroller.config import Configurator
+from steamcontroller.events import PadModes, StickModes, TrigModes
+from steamcontroller.uinput import Keys, Axes
+
+N = 50000
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+
+def _report(i):
+    report = bytearray(os.urandom(64))
+    report[2] = SCStatus.INPUT
+    report[4:6] = (i & 0xffff).to_bytes(2, 'little')
+    return bytes(report)
+
+REPORTS = [_report(i) for i in range(N)]
+
+def script_mapper(name):
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'),
+                                                  os.path.join(SCRIPTS, name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.evminit
+
+def vdf_mapper():
+    # Parsed form of a keyboard and mouse VDF configuration
+    axes = [(axis, -32768, 32767, 16, 128) for axis in [Axes.ABS_X, Axes.ABS_Y]]
+    config = {
+        'left_trackpad' : {'active' : {'mode' : PadModes.BUTTONCLICK, 'buttons' : {
+            'north' : Keys.KEY_W, 'west' : Keys.KEY_A,
+            'south' : Keys.KEY_S, 'east' : Keys.KEY_D}}},
+        'right_trackpad' : {'active' : {'mode' : PadModes.MOUSE, 'buttons' : {
+            'click' : Keys.BTN_LEFT}}},
+        'joystick' : {'active' : {'mode' : StickModes.AXIS, 'axes' : axes,
+                                  'buttons' : {'click' : None}}},
+        'button_diamond' : {'active' : {'buttons' : {
+            'a' : Keys.KEY_SPACE, 'b' : Keys.KEY_E,
+            'x' : Keys.KEY_R, 'y' : Keys.KEY_F}}},
+        'switch' : {},
+        'left_trigger' : {'active' : {'mode' : TrigModes.BUTTON, 'buttons' : {
+            'click' : Keys.BTN_RIGHT}}},
+        'right_trigger' : {'active' : {'mode' : TrigModes.BUTTON, 'buttons' : {
+            'click' : Keys.BTN_LEFT}}},
+    }
+    def evminit():
+        configurator = Configurator('bench')
+        configurator.import_config(config)
+        return configurator.evm
+    return evminit
+
+def pipeline(evminit, subscribe):
+    evm = evminit()
+    sc = SteamController(callback=evm.process,
+                         transport=FakeTransport(iter(REPORTS)),
+                         fields=evm.getFields() if subscribe else None)
+    start = time.process_time()
+    sc.run()
+    return 1e6 * (time.process_time() - start) / N
+
+if __name__ == '__main__':
+    full = ReportDecoder().decode
+    buf = memoryview(bytearray(REPORTS[0]))
+    t = min(timeit.repeat(lambda: full(buf), number=N, repeat=5))
+    print('{:18s} {:10.0f} reports/s'.format('decode all', N / t))
+
+    profiles = [('xbox', script_mapper('sc-xbox')),
+                ('desktop', script_mapper('sc-desktop')),
+                ('vdf', vdf_mapper())]
+    for name, evminit in profiles:
+        fields = evminit().getFields()
+        subset = ReportDecoder(fields).decode
+        t = min(timeit.repeat(lambda: subset(buf), number=N, repeat=5))
+        print('{:18s} {:10.0f} reports/s'.format('decode ' + name, N / t))
+
+    for name, evminit in profiles:
+        t_all = pipeline(evminit, False)
+        t_sub = pipeline(evminit, True)
+        print('{:8s} pipeline all fields {:.2f}us/report, subscribed {:.2f}us/report'.format(
+            name, t_all, t_sub))
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+"""
+Import time of steamcontroller.uinput as reported by python -X importtime,
+with the kernel input constants parsed from the headers and loaded from
+the cache (see steamcontroller.cheader.cached_defines).
+"""
+
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+N = 10
+MODULE = 'steamcontroller.uinput'
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)')
+
+def importtime(env):
+    """Return self and cumulative import time of MODULE in us"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + MODULE],
+                          env=env, stderr=subprocess.PIPE, universal_newlines=True,
+                          check=True)
+    for line in proc.stderr.splitlines():
+        m = LINE.match(line)
+        if m and m.group(3) == MODULE:
+            return int(m.group(1)), int(m.group(2))
+    raise RuntimeError(proc.stderr)
+
+with tempfile.TemporaryDirectory() as cache:
+    env = dict(os.environ, XDG_CACHE_HOME=cache)
+    env.pop('STEAMCONTROLLER_NOCACHE', None)
+    nocache = dict(env, STEAMCONTROLLER_NOCACHE='1')
+
+    # Fill the cache
+    importtime(env)
+
+    for name, e in [('parse', nocache), ('cache', env)]:
+        self_us, cumul_us = min(importtime(e) for _ in range(N))
+        print('{:8s} self {:8.1f} ms  cumulative {:8.1f} ms'.format(name, self_us / 1000.0, cumul_us / 1000.0))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""
+Throughput of the whole input pipeline without hardware: synthetic reports
+fed by a FakeTransport, decoded by SteamController and mapped by an xbox
+like EventMapper to a uinput gamepad, as fast as possible.
+
+The pipeline runs twice, the second time with a LatencyProfiler whose
+histograms are printed, to show its overhead.
+
+Needs write access to /dev/uinput. A session recorded with
+sc-dump.py -r can be replayed instead of the synthetic reports:
+
+    bench_pipeline.py [session.scr]
+"""
+
+import math
+import sys
+import time
+
+from steamcontroller import \
+    SteamController, \
+    SCButtons, \
+    SCStatus, \
+    SCI_STRUCT, \
+    SCI_NULL
+from steamcontroller.transport import FakeTransport
+from steamcontroller.events import EventMapper, Pos
+from steamcontroller.uinput import Keys, Axes
+from steamcontroller.profiler import LatencyProfiler
+
+N = 100000
+
+def synthetic(n):
+    """Reports with a circling stick, a sliding pad and pressed buttons"""
+    buttons = [0, SCButtons.A, SCButtons.A | SCButtons.RB, SCButtons.X]
+    for i in range(n):
+        a = i * 2 * math.pi / 250
+        yield SCI_STRUCT.pack(*SCI_NULL._replace(
+            status=SCStatus.INPUT,
+            seq=i & 0xffff,
+            buttons=buttons[(i // 50) % len(buttons)] | SCButtons.RPADTOUCH,
+            ltrig=(i * 3) & 0xff,
+            rpad_x=int(20000 * math.sin(a)),
+            rpad_y=int(20000 * math.cos(a)),
+            lpad_x=int(32000 * math.cos(a)),
+            lpad_y=int(32000 * math.sin(a))))
+
+def evminit():
+    evm = EventMapper()
+    evm.setStickAxes(Axes.ABS_X, Axes.ABS_Y)
+    evm.setPadAxes(Pos.RIGHT, Axes.ABS_RX, Axes.ABS_RY)
+    evm.setTrigAxis(Pos.LEFT, Axes.ABS_Z)
+    evm.setTrigAxis(Pos.RIGHT, Axes.ABS_RZ)
+    evm.setButtonAction(SCButtons.A, Keys.BTN_A)
+    evm.setButtonAction(SCButtons.X, Keys.BTN_X)
+    evm.setButtonAction(SCButtons.RB, Keys.BTN_TR)
+    return evm
+
+def bench(prof=None):
+    if len(sys.argv) > 1:
+        transport = FakeTransport.fromSession(sys.argv[1])
+    else:
+        transport = FakeTransport(synthetic(N))
+
+    evm = evminit()
+    evm.setProfiler(prof)
+    sc = SteamController(callback=evm.process, transport=transport,
+                         profiler=prof)
+
+    wall = time.time()
+    cpu = time.process_time()
+    sc.run()
+    wall = time.time() - wall
+    cpu = time.process_time() - cpu
+
+    n = sc.getStats()['reports']
+    print('{:8s} {:d} reports in {:.2f}s: {:.0f} reports/s, {:.1f}us cpu/report'.format(
+        'profiled' if prof else 'plain', n, wall, n / wall, 1e6 * cpu / n))
+    print('{:8s} {:d} control messages captured'.format('', len(transport.controls)))
+
+if __name__ == '__main__':
+    bench()
+    prof = LatencyProfiler()
+    bench(prof)
+    print('')
+    prof.dump(sys.stdout)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""
+Live reload of a VDF profile: the file is saved again every RELOAD_EVERY
+reports while a FakeTransport feeds reports at RATE per second, switching
+between two bindings. Prints the time from the save to the mapping queued
+by the watcher thread, to the mapping taken by the mapper, and the time
+the swap took on the input path. Does not need /dev/uinput, the events
+are lost.
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+
+from steamcontroller import SteamController, SCStatus, SCI_NULL, SCI_STRUCT, SCButtons
+from steamcontroller.config import Configurator
+from steamcontroller.tools import monotonic
+from steamcontroller.transport import FakeTransport
+from steamcontroller.uinput import Keys
+
+RATE = 250
+RELOADS = 20
+RELOAD_EVERY = 50
+
+VDF = '''"controller_mappings"
+{{
+	"version" "2"
+	"group"
+	{{
+		"id" "0"
+		"mode" "four_buttons"
+		"inputs"
+		{{
+			"button_a" {{ "activators" {{ "Full_Press" {{ "bindings" {{ "binding" "key_press {a}" }} }} }} }}
+			"button_b" {{ "activators" {{ "Full_Press" {{ "bindings" {{ "binding" "key_press E" }} }} }} }}
+			"button_x" {{ "activators" {{ "Full_Press" {{ "bindings" {{ "binding" "key_press R" }} }} }} }}
+			"button_y" {{ "activators" {{ "Full_Press" {{ "bindings" {{ "binding" "key_press F" }} }} }} }}
+		}}
+	}}
+	"group"
+	{{
+		"id" "1"
+		"mode" "{pad}"
+		"inputs"
+		{{
+			"click" {{ "activators" {{ "Full_Press" {{ "bindings" {{ "binding" "mouse_button LEFT" }} }} }} }}
+		}}
+	}}
+	"preset"
+	{{
+		"id" "0"
+		"name" "Default"
+		"group_source_bindings"
+		{{
+			"0" "button_diamond active"
+			"1" "right_trackpad active"
+		}}
+	}}
+}}
+'''
+
+PROFILES = [dict(a='SPACE', pad='absolute_mouse'), dict(a='ENTER', pad='scrollwheel')]
+
+def save(path, profile):
+    """Save like an editor does, write a new file and rename it"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(VDF.format(**profile))
+    os.rename(tmp, path)
+
+def reports(evm, path, delays):
+    """Press A every other report and save the profile again periodically"""
+    saved = None
+    swaps = 0
+    for i in range(RELOADS * RELOAD_EVERY):
+        buttons = SCButtons.A if i & 1 else 0
+        yield SCI_STRUCT.pack(*SCI_NULL._replace(status=SCStatus.INPUT, seq=i, buttons=buttons))
+        if evm.getStats()['mapping_swaps'] != swaps:
+            swaps += 1
+            delays.append(monotonic() - saved)
+        if i % RELOAD_EVERY == 0:
+            saved = monotonic()
+            save(path, PROFILES[(i // RELOAD_EVERY) % 2])
+
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, 'profile.vdf')
+    save(path, PROFILES[1])
+    delays = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        configurator = Configurator('bench', path)
+        watcher = configurator.watch()
+        evm = configurator.evm
+        sc = SteamController(callback=evm.process,
+                             transport=FakeTransport(reports(evm, path, delays), rate=RATE))
+        sc.run()
+
+    stats = evm.getStats()
+    print('report period     {:8.2f} ms'.format(1000.0 / RATE))
+    print('reloads           {:8d}   swaps {:d}'.format(watcher.reloads, stats['mapping_swaps']))
+    print('last parse        {:8.2f} ms  (watcher thread)'.format(watcher.latency * 1000))
+    print('save to swap      {:8.2f} ms  (mean, includes the wait for a report)'.format(
+        1000 * sum(delays) / max(1, len(delays))))
+    print('last swap         {:8.3f} ms  (input path)'.format(stats['swap_time'] * 1000))
+    print('A binding         {}'.format(Keys(evm._btn_map[SCButtons.A][1] - 0x100).name))
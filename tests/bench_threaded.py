@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+"""
+Single loop run() versus runThreaded() with a callback that is sometimes
+slow: report pickup delay (how late reports are taken from the transport)
+and haptic send latency, with a FakeTransport at 1000 reports/s.
+"""
+
+import time
+
+from steamcontroller import SteamController, SCI_STRUCT, SCI_NULL, SCStatus
+from steamcontroller.transport import FakeTransport
+from steamcontroller.threaded import runThreaded
+from steamcontroller.tools import monotonic
+
+N = 3000
+RATE = 1000
+SLOW = 0.008
+
+REPORTS = [SCI_STRUCT.pack(*SCI_NULL._replace(status=SCStatus.INPUT, seq=i))
+           for i in range(N)]
+
+class StampedTransport(FakeTransport):
+    """Keep how late each report is read and when control messages are sent"""
+
+    def __init__(self):
+        FakeTransport.__init__(self, iter(REPORTS), rate=RATE)
+        self.late = []
+        self.sent = []
+
+    def handleEvents(self, timeout=None):
+        if self._next is not None:
+            due = self._next
+            FakeTransport.handleEvents(self, timeout)
+            if self._next != due:
+                self.late.append(monotonic() - due)
+        else:
+            FakeTransport.handleEvents(self, timeout)
+
+    def sendControl(self, data, timeout=0):
+        self.sent.append(monotonic())
+        FakeTransport.sendControl(self, data, timeout)
+
+def summary(name, values):
+    values = sorted(values)
+    return '{} p50={:.2f}ms p99={:.2f}ms max={:.2f}ms'.format(
+        name,
+        1e3 * values[len(values) // 2],
+        1e3 * values[int(len(values) * 0.99)],
+        1e3 * values[-1])
+
+def bench(threaded):
+    transport = StampedTransport()
+    queued = []
+
+    def cb(sc, sci):
+        if sci.seq % 50 == 0:
+            # Slow mapping step, then a haptic feedback
+            time.sleep(SLOW)
+            queued.append(monotonic())
+            sc.addFeedback(0)
+
+    sc = SteamController(callback=cb, transport=transport)
+    sent = len(transport.sent)
+    if threaded:
+        runThreaded(sc)
+    else:
+        sc.run()
+
+    haptic = [s - q for q, s in zip(queued, transport.sent[sent:])]
+    print('{:8s} {}  {}'.format('threaded' if threaded else 'single',
+                                summary('pickup', transport.late),
+                                summary('haptic', haptic)))
+    stats = sc.getStats()
+    if threaded:
+        print('{:8s} ring max depth {:d}, dropped {:d}'.format(
+            '', stats['ring_max_depth'], stats['ring_dropped']))
+
+if __name__ == '__main__':
+    bench(False)
+    bench(True)
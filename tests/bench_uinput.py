@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+"""
+Cost of the uinput output, written to /dev/null so no uinput device is
+needed:
+ - events/s through UInput.axisEvent, with one libuinput call by event
+   (ctypes wrappers built by call as before, or the shared library)
+   and with events buffered until the syn event
+ - a report moving both sticks and a trigger, one write by event or one
+   write by frame
+"""
+
+import ctypes
+import os
+import timeit
+
+from steamcontroller.uinput import Gamepad, Axes, loadLibrary
+
+N = 100000
+
+class Legacy(Gamepad):
+    """Per event calls with ctypes wrappers on a private library handle"""
+
+    def axisEvent(self, axis, val):
+        self._lib.uinput_abs(self._fd,
+                             ctypes.c_uint16(axis),
+                             ctypes.c_int32(val))
+        self._writes += 1
+        self._events += 1
+
+    def synEvent(self):
+        self._lib.uinput_syn(self._fd)
+        self._writes += 1
+        self._events += 1
+        self._frames += 1
+
+def gamepad(mode):
+    """Gamepad writing to /dev/null"""
+    if mode == 'legacy':
+        dev = Legacy()
+        dev._lib = ctypes.CDLL(loadLibrary()._name)
+    else:
+        dev = Gamepad()
+        dev._lib = loadLibrary()
+    dev._fd = os.open(os.devnull, os.O_WRONLY)
+    dev._setupWrites()
+    if mode != 'frame':
+        dev._buf = None
+    return dev
+
+def close(dev):
+    os.close(dev._fd)
+    dev._fd = None
+
+def events(dev):
+    dev.axisEvent(Axes.ABS_X, 1200)
+
+def frame(dev):
+    dev.axisEvent(Axes.ABS_X, 1200)
+    dev.axisEvent(Axes.ABS_Y, -3400)
+    dev.axisEvent(Axes.ABS_RX, 560)
+    dev.axisEvent(Axes.ABS_RY, -780)
+    dev.axisEvent(Axes.ABS_Z, 90)
+    dev.synEvent()
+
+MODES = ['legacy', 'typed', 'frame']
+
+for mode in MODES:
+    dev = gamepad(mode)
+    t = min(timeit.repeat(lambda: events(dev), number=N, repeat=3))
+    dev.synEvent()
+    close(dev)
+    print('axisEvent {:6s} {:10.0f} events/s'.format(mode, N / t))
+
+print()
+for mode in MODES:
+    dev = gamepad(mode)
+    t = min(timeit.repeat(lambda: frame(dev), number=N, repeat=3))
+    stats = dev.getStats()
+    close(dev)
+    print('report    {:6s} {:8.2f} us/report  {:4.1f} writes/report'.format(
+        mode, t / N * 1e6, float(stats['writes']) / stats['frames']))